@@ -22,7 +22,7 @@ __all__ = ['__author__', '__version__',
            'config', 'conn', 'kill', 'BaseRelation',
            'Connection', 'Heading', 'FreeRelation', 'Not', 'schema',
            'Manual', 'Lookup', 'Imported', 'Computed', 'Part',
-           'AndList', 'OrList', 'ERD', 'U']
+           'AndList', 'OrList', 'ERD', 'U', 'async_inserter']
 
 print('DataJoint', __version__, '('+__date__+')')
 
@@ -75,6 +75,7 @@ logger.setLevel(log_levels[config['loglevel']])
 # ------------- flatten import hierarchy -------------------------
 from .connection import conn, Connection
 from .base_relation import FreeRelation, BaseRelation
+from .inserter import async_inserter
 from .user_relations import Manual, Lookup, Imported, Computed, Part
 from .relational_operand import Not, AndList, OrList, U
 from .heading import Heading
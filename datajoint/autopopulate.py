@@ -4,7 +4,7 @@ import datetime
 import random
 from pymysql import OperationalError
 from .relational_operand import RelationalOperand, AndList
-from . import DataJointError
+from . import DataJointError, config
 from .base_relation import FreeRelation
 
 # noinspection PyExceptionInherit,PyCallingNonCallable
@@ -119,17 +119,39 @@ class AutoPopulate:
                             jobs.complete(self.target.table_name, key)
         return error_list
 
+    def _rows_per_key(self):
+        """
+        :return: the average number of rows of the target per key of the key source, estimated from the
+        cardinality of the target's primary index.
+        """
+        database, table_name = (s.strip('`') for s in self.target.full_table_name.split('.'))
+        cardinality = dict(self.connection.query(
+            "SELECT seq_in_index, cardinality FROM information_schema.statistics "
+            "WHERE table_schema=%s AND table_name=%s AND index_name='PRIMARY'", args=(database, table_name)))
+        prefix = cardinality.get(len(self.key_source.primary_key))
+        full = cardinality.get(max(cardinality, default=None))
+        return full / prefix if prefix and full and full > prefix else 1
+
     def progress(self, *restrictions, display=True):
         """
         report progress of populating this table
+        If config['display.estimated_counts'] is set, the counts are estimated rather than counted.
         :return: remaining, total -- tuples to be populated
         """
         todo = self.key_source & AndList(restrictions)
-        total = len(todo)
-        remaining = len(todo - self.target.proj())
+        if config['display.estimated_counts']:
+            # EXPLAIN does not reduce its estimate for the antijoin todo - target, so the completed keys are
+            # estimated from the rows of the target instead.
+            total = todo.estimate_len()
+            done = (self.target & todo) if restrictions else self.target
+            remaining = total - min(total, int(round(done.estimate_len() / self._rows_per_key())))
+        else:
+            total = len(todo)
+            remaining = len(todo - self.target.proj())
         if display:
             print('%-20s' % self.__class__.__name__,
-                  'Completed %d of %d (%2.1f%%)   %s' % (
+                  'Completed %s%d of %d (%2.1f%%)   %s' % (
+                      '~' if config['display.estimated_counts'] else '',
                       total - remaining, total, 100 - 100 * remaining / (total+1e-12),
                       datetime.datetime.strftime(datetime.datetime.now(), '%Y-%m-%d %H:%M:%S')), flush=True)
         return remaining, total
@@ -1,10 +1,16 @@
 import collections
+import contextlib
 import itertools
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 import logging
 from . import config, DataJointError
 from .declare import declare
-from .relational_operand import RelationalOperand
+from .relational_operand import RelationalOperand, compilation_scope
 from .blob import pack
 from .utils import user_choice
 from .heading import Heading
@@ -12,6 +18,79 @@ from .heading import Heading
 logger = logging.getLogger(__name__)
 
 
+_pack_executors = {}  # number of threads: executor
+_pack_executors_lock = threading.Lock()
+
+
+def pack_executor():
+    """
+    :return: the thread pool shared by inserts for packing blobs, with config['insert.pack_threads'] threads, or None
+    if blobs are packed serially.  Pools are kept for each number of threads that has been configured because other
+    threads may still be submitting to them.
+    """
+    threads = config['insert.pack_threads']
+    if not threads or threads <= 1:
+        return None
+    with _pack_executors_lock:
+        if threads not in _pack_executors:
+            _pack_executors[threads] = ThreadPoolExecutor(threads)
+        return _pack_executors[threads]
+
+
+def pack_rows(rows, positions):
+    """
+    Packs the blobs in rows.  With a thread pool from pack_executor, the blobs of the next chunk of rows are packed
+    in the pool while the rows of the current chunk are consumed.  zlib releases the GIL so packing runs in parallel.
+    :param rows: iterable of lists of values
+    :param positions: the positions of blob values in each row.  None values are not packed.
+    :return: generator of the rows with their blobs packed in place
+    """
+    executor = pack_executor() if positions else None
+    if executor is None:
+        for row in rows:
+            for i in positions:
+                if row[i] is not None:
+                    row[i] = pack(row[i])
+            yield row
+        return
+    rows = iter(rows)
+    chunk_size = 4 * config['insert.pack_threads']
+    pending = []
+    while True:
+        chunk = [(row, [None if row[i] is None else executor.submit(pack, row[i]) for i in positions])
+                 for row in itertools.islice(rows, chunk_size)]
+        for row, futures in pending:
+            for i, future in zip(positions, futures):
+                if future is not None:
+                    row[i] = future.result()
+            yield row
+        if not chunk:
+            break
+        pending = chunk
+
+
+def tsv_quote(value):
+    """
+    :return: value formatted as a field of a tab-separated file for LOAD DATA with the default escape character
+    """
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n')
+
+
+def as_columns(rows):
+    """
+    :param rows: the rows argument of insert
+    :return: an OrderedDict mapping attribute names to columns if rows is columnar: a structured numpy array, a
+    mapping of attribute names to sequences, or a pandas.DataFrame.  None otherwise.
+    """
+    if isinstance(rows, np.ndarray) and rows.dtype.names is not None:
+        return collections.OrderedDict((name, rows[name].ravel()) for name in rows.dtype.names)
+    if isinstance(rows, collections.abc.Mapping):
+        return collections.OrderedDict(rows)
+    if hasattr(rows, 'columns') and hasattr(rows, 'iloc'):  # pandas.DataFrame; its index is not inserted
+        return collections.OrderedDict((name, rows[name].values) for name in rows.columns)
+    return None
+
+
 class BaseRelation(RelationalOperand):
     """
     BaseRelation is an abstract class that represents a base relation, i.e. a table in the database.
@@ -101,50 +180,73 @@ class BaseRelation(RelationalOperand):
         """
         self.insert((row,), **kwargs)
 
-    def insert(self, rows, replace=False, ignore_errors=False, skip_duplicates=False):
+    def insert(self, rows, replace=False, ignore_errors=False, skip_duplicates=False, method='insert'):
         """
         Insert a collection of rows. Additional keyword arguments are passed to insert1.
 
-        :param rows: An iterable where an element is a valid arguments for insert1.
-        :param replace: If True, replaces the matching data tuple in the table if it exists.
+        :param rows: An iterable where an element is a valid arguments for insert1, or columns: a structured numpy
+        array, a dict mapping attribute names to arrays or lists, or a pandas.DataFrame.  rows can also be a
+        relation whose attributes are attributes of this table; it is inserted with INSERT ... SELECT on the server.
+        Iterables such as generators are consumed as the statements are sent, so memory use does not grow with the
+        number of rows.
+        :param replace: If True, replaces the matching data tuple in the table if it exists.  See also merge.
         :param ignore_errors: If True, ignore errors: e.g. constraint violations.
-        :param skip_duplicates: If True, silently skip duplicate inserts.
+        :param skip_duplicates: If True, silently skip rows whose primary key is already in the table.  Rows that
+        duplicate the values of a unique secondary index are skipped as well rather than raising an IntegrityError.
+        :param method: 'insert' sends INSERT statements.  'load_data' writes the rows into a temporary file and
+        loads it with LOAD DATA LOCAL INFILE, which is faster for very large inserts.  It requires
+        config['database.local_infile'] to be set before connecting.  With 'load_data', the server skips rows
+        that duplicate a key instead of raising an error.
 
         Example::
         >>> relation.insert([
         >>>     dict(subject_id=7, species="mouse", date_of_birth="2014-09-01"),
         >>>     dict(subject_id=8, species="mouse", date_of_birth="2014-09-02")])
         """
+        if method not in ('insert', 'load_data'):
+            raise DataJointError('Invalid insert method "%s"' % method)
         heading = self.heading
+        command = 'REPLACE' if replace else 'INSERT IGNORE' if ignore_errors else 'INSERT'
+        if isinstance(rows, RelationalOperand):
+            if method == 'load_data':
+                raise DataJointError("Relations are inserted on the server and cannot be inserted with "
+                                     "method='load_data'.")
+            self._insert_select(command, rows, skip_duplicates=skip_duplicates)
+            return
+        columns = as_columns(rows)
+        if columns is not None:
+            if method == 'load_data':
+                self._load_data(*self._format_columns(columns, null='\\N', quote=tsv_quote,
+                                                      quote_blob=lambda blob: blob.hex()),
+                                replace=replace, ignore=ignore_errors or skip_duplicates)
+            else:
+                fields, rows = self._format_columns(columns, null='NULL', quote=self.connection.escape,
+                                                    quote_blob=self.connection.escape)
+                self._execute_insert(command, fields, ('(' + ','.join(row) + ')' for row in rows),
+                                     skip_duplicates=skip_duplicates)
+            return
+
         field_list = None  # ensures that all rows have the same attributes in the same order as the first row.
 
         def make_row_to_insert(row):
             """
             :param row:  A tuple to insert
-            :return: a dict with fields 'names', 'placeholders', 'values'
+            :return: a dict with fields 'names' and 'values'
             """
 
-            def make_placeholder(name, value):
+            def make_value(name, value):
                 """
-                For a given attribute `name` with `value`, return its processed value or value placeholder
-                as a string to be included in the query and the value, if any, to be submitted for
-                processing by mysql API.
+                For a given attribute `name` with `value`, return the value to be escaped into the statement.
+                Blobs are packed later by pack_rows.  None values are inserted as NULL.
                 :param name:
                 :param value:
                 """
-                if heading[name].is_blob:
-                    value = pack(value)
-                    placeholder = '%s'
-                elif heading[name].numeric:
+                if heading[name].numeric and not heading[name].is_blob:
                     if value is None or np.isnan(value):  # nans are turned into NULLs
-                        placeholder = 'NULL'
                         value = None
                     else:
-                        placeholder = '%s'
                         value = repr(int(value) if isinstance(value, bool) else value)
-                else:
-                    placeholder = '%s'
-                return name, placeholder, value
+                return name, value
 
             def check_fields(fields):
                 """
@@ -160,11 +262,10 @@ class BaseRelation(RelationalOperand):
 
             if isinstance(row, np.void):  # np.array
                 check_fields(row.dtype.fields)
-                attributes = [make_placeholder(name, row[name])
-                              for name in heading if name in row.dtype.fields]
+                attributes = [make_value(name, row[name]) for name in heading if name in row.dtype.fields]
             elif isinstance(row, collections.abc.Mapping):  # dict-based
                 check_fields(row.keys())
-                attributes = [make_placeholder(name, row[name]) for name in heading if name in row]
+                attributes = [make_value(name, row[name]) for name in heading if name in row]
             else:  # positional
                 try:
                     if len(row) != len(heading):
@@ -175,10 +276,10 @@ class BaseRelation(RelationalOperand):
                 except TypeError:
                     raise DataJointError('Datatype %s cannot be inserted' % type(row))
                 else:
-                    attributes = [make_placeholder(name, value) for name, value in zip(heading, row)]
+                    attributes = [make_value(name, value) for name, value in zip(heading, row)]
 
             assert len(attributes), 'Empty tuple'
-            row_to_insert = dict(zip(('names', 'placeholders', 'values'), zip(*attributes)))
+            row_to_insert = dict(zip(('names', 'values'), zip(*attributes)))
             nonlocal field_list
             if field_list is None:
                 # first row sets the composition of the field list
@@ -187,41 +288,298 @@ class BaseRelation(RelationalOperand):
                 #  reorder attributes in row_to_insert to match field_list
                 order = list(row_to_insert['names'].index(field) for field in field_list)
                 row_to_insert['names'] = list(row_to_insert['names'][i] for i in order)
-                row_to_insert['placeholders'] = list(row_to_insert['placeholders'][i] for i in order)
                 row_to_insert['values'] = list(row_to_insert['values'][i] for i in order)
 
             return row_to_insert
 
-        def row_exists(row):
-            """
-            :param row: a dict with keys 'row' and 'values'.
-            :return: True if row is already in table.
-            """
-            primary_key_value = dict((name, value)
-                                     for (name, value) in zip(row['names'], row['values']) if heading[name].in_key)
-            return primary_key_value in self
-
-        rows = list(make_row_to_insert(row) for row in rows)
-        if rows:
-            # skip duplicates only if the entire primary key is specified.
-            skip_duplicates = skip_duplicates and set(heading.primary_key).issubset(set(field_list))
-            if skip_duplicates:
-                rows = list(row for row in rows if not row_exists(row))
-            if rows:
+        # rows are converted as they are sent so that generators are consumed in bounded memory.
+        rows = (make_row_to_insert(row) for row in rows)
+        first_row = next(rows, None)  # sets field_list
+        if first_row is None:
+            return
+        blobs = [heading[name].is_blob for name in field_list]
+        rows = pack_rows((list(row['values']) for row in itertools.chain([first_row], rows)),
+                         [i for i, is_blob in enumerate(blobs) if is_blob])
+        if method == 'load_data':
+            self._load_data(
+                field_list,
+                (['\\N' if v is None else v.hex() if is_blob else tsv_quote(v) for v, is_blob in zip(row, blobs)]
+                 for row in rows),
+                replace=replace, ignore=ignore_errors or skip_duplicates)
+        else:
+            escape = self.connection.escape
+            self._execute_insert(
+                command, field_list,
+                ('(' + ','.join('NULL' if v is None else escape(v) for v in row) + ')' for row in rows),
+                skip_duplicates=skip_duplicates)
+
+    def _format_columns(self, columns, null, quote, quote_blob):
+        """
+        Validates columns for insert and formats their values one column at a time.  Numeric columns are
+        formatted by numpy and their NaNs are turned into NULLs without iterating in Python.
+        :param columns: OrderedDict mapping attribute names to arrays or sequences of equal lengths
+        :param null: the representation of NULL
+        :param quote: function formatting a value
+        :param quote_blob: function formatting a packed blob
+        :return: the attribute names in heading order and an iterator of rows of formatted values
+        """
+        heading = self.heading
+        for name in columns:
+            if name not in heading:
+                raise KeyError(u'{0:s} is not in the attribute list'.format(name))
+        fields = [name for name in heading if name in columns]
+        if not fields:
+            raise DataJointError('Empty tuple')
+        scalars = [name for name in fields if isinstance(columns[name], (str, bytes)) or
+                   not hasattr(columns[name], '__len__') or
+                   isinstance(columns[name], np.ndarray) and columns[name].ndim == 0]
+        if scalars:
+            raise DataJointError('Attempt to insert columns that are not sequences: {names}.  Use insert1 to insert '
+                                 'a single row.'.format(names=', '.join(scalars)))
+        if len(set(len(columns[name]) for name in fields)) > 1:
+            raise DataJointError('Attempt to insert columns of different lengths')
+
+        def python_values(column):
+            if isinstance(column, np.ndarray) and column.dtype.kind == 'M':  # tolist() gives integer nanoseconds
+                return column.astype('datetime64[us]').tolist()
+            if isinstance(column, np.ndarray) and column.dtype.kind == 'm':  # formatted as TIME literals
+                micros = column.astype('timedelta64[us]').astype(np.int64).tolist()
+                return [None if nat else '{sign}{h}:{m:02d}:{s:02d}.{us:06d}'.format(
+                    sign='-' if v < 0 else '', h=abs(v) // 3600000000, m=abs(v) // 60000000 % 60,
+                    s=abs(v) // 1000000 % 60, us=abs(v) % 1000000) for v, nat in zip(micros, np.isnat(column))]
+            return column.tolist() if isinstance(column, np.ndarray) else [
+                v.item() if isinstance(v, np.generic) else v for v in column]
+
+        def format_column(attr, column):
+            if attr.is_blob:
+                return [null if row[0] is None else quote_blob(row[0]) for row in pack_rows(([v] for v in column), [0])]
+            if attr.numeric and isinstance(column, np.ndarray) and column.dtype.kind in 'biuf':
+                text = column.astype(str) if column.dtype.kind != 'b' else column.astype(int).astype(str)
+                if column.dtype.kind == 'f':  # nans are turned into NULLs
+                    text = np.where(np.isnan(column), null, text)
+                return text.tolist()
+            if attr.numeric:
+                return [null if v is None or isinstance(v, float) and np.isnan(v) else quote(v)
+                        for v in python_values(column)]
+            return [null if v is None else quote(v) for v in python_values(column)]
+
+        return fields, zip(*(format_column(heading[name], columns[name]) for name in fields))
+
+    def _load_data(self, fields, rows, replace=False, ignore=False):
+        """
+        Writes rows into a temporary tab-separated file and loads it with LOAD DATA LOCAL INFILE.  Blobs are
+        written in hexadecimal and decoded by the server.
+        :param fields: the names of the loaded attributes
+        :param rows: iterable of rows of values formatted for the file, with \\N for NULL
+        :param replace: if True, loaded rows replace the rows with the same keys
+        :param ignore: if True, rows that duplicate a key are skipped.  With LOCAL, the server does this anyway.
+        """
+        if not config['database.local_infile']:
+            raise DataJointError("insert(method='load_data') requires config['database.local_infile'] to be "
+                                 "set to True before connecting.")
+        f = tempfile.NamedTemporaryFile('w', suffix='.tsv', encoding='utf-8', newline='\n', delete=False)
+        try:
+            with f:
+                count = 0
+                for row in rows:
+                    f.write('\t'.join(row) + '\n')
+                    count += 1
+            if count:
+                blobs = [name for name in fields if self.heading[name].is_blob]
+                start = time.time()
+                self.connection.table_modified(self.full_table_name)
                 self.connection.query(
-                    "{command} INTO {destination}(`{fields}`) VALUES {placeholders}".format(
-                        command='REPLACE' if replace else 'INSERT IGNORE' if ignore_errors else 'INSERT',
-                        destination=self.from_clause,
-                        fields='`,`'.join(field_list),
-                        placeholders=','.join('(' + ','.join(row['placeholders']) + ')' for row in rows)),
-                    args=list(itertools.chain.from_iterable((v for v in r['values'] if v is not None) for r in rows)))
+                    "LOAD DATA LOCAL INFILE {file} {mode}INTO TABLE {table} CHARACTER SET utf8mb4 "
+                    "({fields}){blobs}".format(
+                        file=self.connection.escape(f.name),
+                        mode='REPLACE ' if replace else 'IGNORE ' if ignore else '',
+                        table=self.full_table_name,
+                        fields=','.join(('@`%s`' if name in blobs else '`%s`') % name for name in fields),
+                        blobs='' if not blobs else ' SET ' + ','.join(
+                            '`{name}`=UNHEX(@`{name}`)'.format(name=name) for name in blobs)),
+                    args=None)
+                elapsed = max(time.time() - start, 1e-6)
+                logger.info('Loaded {count:,} rows into {table} in {elapsed:.3f} s: {rate:,.0f} rows/s'.format(
+                    count=count, table=self.full_table_name, elapsed=elapsed, rate=count / elapsed))
+        finally:
+            os.remove(f.name)
+
+    def _skip_duplicates_clause(self, command, fields):
+        """
+        :return: the clause that makes an INSERT command skip rows that duplicate a key of the table, if fields
+        include the entire primary key.  A no-op update lets the server skip duplicates without a lookup per row.
+        The server applies the update for a duplicate of any unique index, so rows that collide on a unique secondary
+        index are skipped too.
+        """
+        if not command.startswith('INSERT') or not set(self.primary_key).issubset(fields):
+            return ''
+        return ' ON DUPLICATE KEY UPDATE ' + ','.join(
+            '{table}.`{k}`={table}.`{k}`'.format(table=self.full_table_name, k=k) for k in self.primary_key)
+
+    def _insert_select(self, command, relation, skip_duplicates=False):
+        """
+        Inserts the result of a query with INSERT ... SELECT so that the data do not leave the server.
+        :param command: INSERT, INSERT IGNORE, or REPLACE
+        :param relation: a RelationalOperand whose attributes are attributes of self
+        :param skip_duplicates: if True, rows that duplicate a key of the table are skipped
+        """
+        fields = relation.heading.names
+        for name in fields:
+            if name not in self.heading:
+                raise KeyError(u'{0:s} is not in the attribute list'.format(name))
+        suffix = self._skip_duplicates_clause(command, fields) if skip_duplicates else ''
+        with compilation_scope():
+            select = relation.make_sql()
+        if suffix:  # a derived table keeps the ON clause from being parsed as part of a join in the query
+            select = 'SELECT * FROM ({select}) as `_insert`'.format(select=select)
+        sql = "{command} INTO {destination}(`{fields}`) {select}{suffix}".format(
+            command=command, destination=self.from_clause, fields='`,`'.join(fields), select=select, suffix=suffix)
+        self.connection.table_modified(self.full_table_name)
+        self.connection.query(sql, args=None)
+
+    def _execute_insert(self, command, fields, literals, skip_duplicates=False):
+        """
+        Executes an insert for a sequence of rows in as many statements as needed to keep each statement
+        within the connection's max_allowed_packet and config['insert.max_rows'].  After each statement, the row cap
+        is adjusted so that statements take about config['insert.target_seconds'].  Several statements are
+        executed in a transaction unless one is already in progress.
+        :param command: INSERT, INSERT IGNORE, or REPLACE
+        :param fields: the names of the inserted attributes
+        :param literals: iterable of row literals of the form (value1,value2,...), consumed one statement at a time
+        :param skip_duplicates: if True, rows that duplicate a key of the table are skipped by the server.  Applies
+        to INSERT commands that specify the entire primary key.
+        """
+        statement = "{command} INTO {destination}(`{fields}`) VALUES ".format(
+            command=command, destination=self.from_clause, fields='`,`'.join(fields))
+        suffix = self._skip_duplicates_clause(command, fields) if skip_duplicates else ''
+        max_rows = config['insert.max_rows']
+        target_seconds = config['insert.target_seconds']
+        budget = self.connection.max_allowed_packet - len((statement + suffix).encode()) - 1024  # room for header
+        row_cap = max_rows
+
+        def make_batches():
+            batch, size = [], 0
+            for literal in literals:
+                row_size = len(literal.encode(errors='surrogateescape')) + 1
+                if row_size > budget:
+                    raise DataJointError(
+                        'A row of {size:,} bytes cannot be inserted because it exceeds the max_allowed_packet of '
+                        '{max:,} bytes.'.format(size=row_size, max=self.connection.max_allowed_packet))
+                if batch and (size + row_size > budget or len(batch) >= row_cap):
+                    yield batch, size
+                    batch, size = [], 0
+                batch.append(literal)
+                size += row_size
+            if batch:
+                yield batch, size
+
+        def execute(batch, size):
+            nonlocal row_cap
+            start = time.time()
+            self.connection.query(statement + ','.join(batch) + suffix, args=None)
+            elapsed = max(time.time() - start, 1e-6)
+            logger.debug(
+                'Inserted {rows} rows ({size:,} bytes) into {table} in {elapsed:.3f} s: {rate:,.0f} rows/s'.format(
+                    rows=len(batch), size=size, table=self.full_table_name, elapsed=elapsed,
+                    rate=len(batch) / elapsed))
+            if target_seconds:
+                row_cap = max(1, min(max_rows, 2 * row_cap, int(len(batch) * target_seconds / elapsed)))
+
+        batches = make_batches()
+        pending = list(itertools.islice(batches, 2))  # a second batch requires a transaction
+        self.connection.table_modified(self.full_table_name)
+        with (self.connection.transaction if len(pending) > 1 and not self.connection.in_transaction
+              else contextlib.ExitStack()):
+            for batch, size in itertools.chain(pending, batches):
+                execute(batch, size)
+
+    def merge(self, rows):
+        """
+        Inserts rows and updates the existing rows that have the same primary keys.  Unlike insert(replace=True),
+        which deletes and reinserts each matching row, merge first inserts the rows into a temporary staging table
+        with the merged attributes of this table and then applies them in a single INSERT ... SELECT ... ON DUPLICATE
+        KEY UPDATE statement, so the table is only locked while that statement runs.  Only the attributes given in
+        rows are updated.  When rows omit attributes that have no default, they can only update existing rows: they
+        are applied with UPDATE ... JOIN, and rows with new keys raise an error.  merge can be called inside a
+        transaction.
+        :param rows: the rows in any form accepted by insert.  They must include the primary key.
+        :raise DataJointError: if rows with new keys omit attributes that have no default
+
+        Example:
+        >>> Subject().merge(updated_subjects)
+        """
+        heading = self.heading
+        columns = None if isinstance(rows, RelationalOperand) else as_columns(rows)
+        if isinstance(rows, RelationalOperand):
+            fields = rows.heading.names
+        elif columns is not None:
+            fields = [name for name in heading if name in columns]
+        else:
+            rows = iter(rows)
+            first_row = next(rows, None)
+            if first_row is None:
+                return
+            rows = itertools.chain([first_row], rows)
+            fields = (first_row.dtype.names if isinstance(first_row, np.void) else
+                      first_row.keys() if isinstance(first_row, collections.abc.Mapping) else heading.names)
+            fields = [name for name in heading if name in fields]
+        missing = [name for name in self.primary_key if name not in fields]
+        if missing:
+            raise DataJointError('Rows cannot be merged without the primary key attributes %s' % ', '.join(missing))
+        stage = FreeRelation(self.connection, '`{database}`.`~merge_{table}`'.format(
+            database=self.database, table=self.table_name[:57]))
+        stage._heading = heading
+        # the staging table is created with only the merged attributes in a single statement: unlike ALTER TABLE,
+        # CREATE TEMPORARY TABLE does not commit the caller's transaction.
+        self.connection.query(
+            'CREATE TEMPORARY TABLE {stage} (PRIMARY KEY (`{keys}`)) SELECT `{fields}` FROM {table} LIMIT 0'.format(
+                stage=stage.full_table_name, keys='`,`'.join(self.primary_key), fields='`,`'.join(fields),
+                table=self.full_table_name))
+        # attributes that new rows cannot omit: the server would fail in strict mode or insert implicit defaults
+        required = [name for name in heading if name not in fields and not heading[name].nullable and
+                    heading[name].default is None and not heading[name].autoincrement]
+        try:
+            stage.insert(rows if columns is None else columns)
+            keys = '`,`'.join(self.primary_key)
+            if required:
+                new_rows = self.connection.query(
+                    'SELECT COUNT(*) FROM {stage} as `_stage` LEFT JOIN {table} as `_target` USING (`{keys}`) '
+                    'WHERE `_target`.`{key}` IS NULL'.format(
+                        stage=stage.full_table_name, table=self.full_table_name, keys=keys,
+                        key=self.primary_key[0])).fetchone()[0]
+                if new_rows:
+                    raise DataJointError(
+                        '{count} rows cannot be merged because their keys are not in {table} and they omit the '
+                        'attributes {required}'.format(count=new_rows, table=self.full_table_name,
+                                                       required=', '.join(required)))
+                updates = [name for name in fields if name not in self.primary_key]
+                if updates:
+                    self.connection.table_modified(self.full_table_name)
+                    self.connection.query(
+                        'UPDATE {table} as `_target` JOIN {stage} as `_stage` USING (`{keys}`) SET {updates}'.format(
+                            table=self.full_table_name, stage=stage.full_table_name, keys=keys,
+                            updates=','.join('`_target`.`{0}`=`_stage`.`{0}`'.format(name) for name in updates)))
+            else:
+                updates = [name for name in fields if name not in self.primary_key] or self.primary_key
+                self.connection.table_modified(self.full_table_name)
+                self.connection.query(
+                    'INSERT INTO {table}(`{fields}`) SELECT `{fields}` FROM {stage} '
+                    'ON DUPLICATE KEY UPDATE {updates}'.format(
+                        table=self.full_table_name, stage=stage.full_table_name, fields='`,`'.join(fields),
+                        updates=','.join('{table}.`{name}`=VALUES(`{name}`)'.format(
+                            table=self.full_table_name, name=name) for name in updates)))
+        finally:
+            self.connection.query('DROP TEMPORARY TABLE IF EXISTS ' + stage.full_table_name)
 
     def delete_quick(self):
         """
         Deletes the table without cascading and without user prompt. If this table has any dependent
         table(s), this will fail.
         """
-        self.connection.query('DELETE FROM ' + self.from_clause + self.where_clause)
+        with compilation_scope():
+            sql = 'DELETE FROM ' + self.from_clause + self.where_clause
+        self.connection.table_modified(self.full_table_name)
+        self.connection.query(sql)
 
     def delete(self):
         """
@@ -259,11 +617,11 @@ class BaseRelation(RelationalOperand):
         if config['safemode']:
             print('The contents of the following tables are about to be deleted:')
         for relation in list(relations_to_delete.values()):
-            count = len(relation)
-            if count:
+            if relation:
                 do_delete = True
                 if config['safemode']:
-                    print(relation.full_table_name, '(%d tuples)' % count)
+                    print(relation.full_table_name, '(%s tuples)' % (
+                        '~%d' % relation.estimate_len() if config['display.estimated_counts'] else len(relation)))
             else:
                 relations_to_delete.pop(relation.full_table_name)
         if not do_delete:
@@ -282,6 +640,7 @@ class BaseRelation(RelationalOperand):
         If the table has any dependent table(s), this call will fail with an error.
         """
         if self.is_declared:
+            self.connection.query_cache.invalidate(self.full_table_name)
             self.connection.query('DROP TABLE %s' % self.full_table_name)
             logger.info("Dropped table %s" % self.full_table_name)
         else:
@@ -297,13 +656,26 @@ class BaseRelation(RelationalOperand):
         tables = self.connection.dependencies.descendants(self.full_table_name)
         if config['safemode']:
             for table in tables:
-                print(table, '(%d tuples)' % len(FreeRelation(self.connection, table)))
+                relation = FreeRelation(self.connection, table)
+                print(table, '(%s tuples)' % (
+                    '~%d' % relation.estimate_len() if config['display.estimated_counts'] else len(relation)))
             do_drop = user_choice("Proceed?", default='no') == 'yes'
         if do_drop:
             for table in reversed(tables):
                 FreeRelation(self.connection, table).drop_quick()
             print('Tables dropped.  Restart kernel.')
 
+    def estimate_len(self):
+        """
+        :return: an estimate of the number of tuples in the table.  Unrestricted tables use
+        information_schema.TABLES.TABLE_ROWS, which InnoDB maintains without scanning the table.
+        """
+        if self.is_restricted:
+            return super().estimate_len()
+        return self.connection.query(
+            'SELECT table_rows FROM information_schema.tables WHERE table_schema=%s AND table_name=%s',
+            args=(self.database, self.table_name)).fetchone()[0] or 0
+
     @property
     def size_on_disk(self):
         """
@@ -0,0 +1,138 @@
+"""
+This module hosts the QueryCache class, the client-side cache of query results kept by each dj.Connection.
+"""
+import collections
+import logging
+import sys
+import time
+from . import config
+
+logger = logging.getLogger(__name__)
+
+_Entry = collections.namedtuple('_Entry', ('rows', 'description', 'size', 'tables', 'update_times', 'checked'))
+
+
+class QueryCache:
+    """
+    A least-recently-used cache of query results keyed by the SQL text of the query.
+    The total size of the cached results is limited by max_bytes, which is read from config['cache.max_bytes']
+    at each fetch unless it is set on the cache.  The cache is disabled when max_bytes is 0, which is the default.
+
+    An entry is invalidated when DataJoint inserts into, deletes from, or drops any of the tables that its query
+    reads from.  Writes made by other clients are detected by checking information_schema.TABLES.UPDATE_TIME once
+    the entry is older than config['cache.revalidate'] seconds.  Entries for tables whose UPDATE_TIME is not
+    tracked by the server are refetched at every revalidation.
+
+    :param connection: the dj.Connection whose queries are cached
+    :param max_bytes: the maximum total size of cached results.  None defers to config['cache.max_bytes'].
+    """
+
+    def __init__(self, connection, max_bytes=None):
+        self.connection = connection
+        self._max_bytes = max_bytes
+        self._entries = collections.OrderedDict()
+        self._size = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def max_bytes(self):
+        """
+        :return: the maximum total size of cached results
+        """
+        return config['cache.max_bytes'] if self._max_bytes is None else self._max_bytes
+
+    @max_bytes.setter
+    def max_bytes(self, max_bytes):
+        self._max_bytes = max_bytes
+
+    @property
+    def size(self):
+        """
+        :return: the estimated size of the cached results in bytes
+        """
+        return self._size
+
+    def fetch(self, sql, relation, as_dict=False, raw_numeric=False):
+        """
+        :param sql: the query
+        :param relation: the relation that the query is compiled from
+        :param as_dict: if True, rows are returned as dicts
+        :param raw_numeric: if True, numeric values are returned unparsed. See Connection.query.
+        :return: (rows, description): the rows returned by the query and the cursor description of its fields,
+        from the cache if possible.
+        """
+        max_bytes = self.max_bytes
+        if not max_bytes:
+            cur = self.connection.query(sql, as_dict=as_dict, raw_numeric=raw_numeric)
+            return cur.fetchall(), cur.description
+        key = (sql, as_dict, raw_numeric)
+        entry = self._entries.get(key)
+        if entry is not None and self._is_valid(key, entry):
+            self._entries.move_to_end(key)
+            logger.debug('Query cache hit: ' + sql[0:300])
+            return entry.rows, entry.description
+        cur = self.connection.query(sql, as_dict=as_dict, raw_numeric=raw_numeric)
+        rows = cur.fetchall()
+        size = sum(sys.getsizeof(value) for row in rows for value in (row.values() if as_dict else row))
+        if size <= max_bytes:
+            tables = relation.source_tables
+            self._drop(key)
+            self._entries[key] = _Entry(rows=rows, description=cur.description, size=size, tables=tables,
+                                        update_times=self._update_times(tables), checked=time.time())
+            self._size += size
+            while self._size > max_bytes:
+                self._drop(next(iter(self._entries)))
+        return rows, cur.description
+
+    def invalidate(self, full_table_name):
+        """
+        Drops the entries whose queries read from the table.
+        :param full_table_name: in the form `database`.`table_name`
+        """
+        for key in [key for key, entry in self._entries.items() if full_table_name in entry.tables]:
+            self._drop(key)
+
+    def clear(self):
+        """
+        Drops all entries.
+        """
+        self._entries.clear()
+        self._size = 0
+
+    def _drop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._size -= entry.size
+
+    def _is_valid(self, key, entry):
+        """
+        :return: False if the entry was dropped because its tables may have been modified by other clients
+        """
+        interval = config['cache.revalidate']
+        if interval is None or time.time() - entry.checked < interval:
+            return True
+        update_times = self._update_times(entry.tables)
+        if update_times != entry.update_times or None in update_times.values():
+            self._drop(key)
+            return False
+        self._entries[key] = entry._replace(checked=time.time())
+        return True
+
+    def _update_times(self, tables):
+        """
+        :param tables: full table names
+        :return: dict mapping each table to its UPDATE_TIME or to None if it is not tracked
+        """
+        if config['cache.revalidate'] is None or not tables:
+            return {}
+        names = [tuple(s.strip('`') for s in table.split('.')) for table in tables]
+        update_times = dict.fromkeys(tables)
+        update_times.update(
+            ('`%s`.`%s`' % (database, table_name), update_time)
+            for database, table_name, update_time in self.connection.query(
+                'SELECT table_schema, table_name, update_time FROM information_schema.tables '
+                'WHERE (table_schema, table_name) IN (%s)' % ','.join(['(%s,%s)'] * len(names)),
+                args=[s for name in names for s in name]).fetchall())
+        return update_times
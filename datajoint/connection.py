@@ -2,6 +2,7 @@
 This module hosts the Connection class that manages the connection to the mysql database,
  and the `conn` function that provides access to a persistent connection in datajoint.
 """
+import itertools
 import warnings
 from contextlib import contextmanager
 import pymysql as client
@@ -11,6 +12,8 @@ from . import config
 from . import DataJointError
 from .dependencies import Dependencies
 from .jobs import JobManager
+from .cache import QueryCache
+from .heading import expression_types
 from pymysql import err
 
 logger = logging.getLogger(__name__)
@@ -69,9 +72,12 @@ class Connection:
             raise DataJointError('Connection failed.')
         self._conn.autocommit(True)
         self._in_transaction = False
+        self._max_allowed_packet = None
+        self._bulk_load_tables = None  # the tables modified in bulk_load
         self.jobs = JobManager(self)
         self.schemas = dict()
         self.dependencies = Dependencies(self)
+        self.query_cache = QueryCache(self)
 
     def __eq__(self, other):
         return self.conn_info == other.conn_info
@@ -87,7 +93,14 @@ class Connection:
 
         :param init_fun: initialization function passed to pymysql
         """
-        self._conn = client.connect(init_command=self.init_fun, **self.conn_info)
+        self._conn = client.connect(init_command=self.init_fun, local_infile=config['database.local_infile'],
+                                    **self.conn_info)
+
+    def close(self):
+        """
+        Closes the connection to the database server.
+        """
+        self._conn.close()
 
     def register(self, schema):
         self.schemas[schema.database] = schema
@@ -105,7 +118,34 @@ class Connection:
         """
         return self._conn.ping()
 
-    def query(self, query, args=(), as_dict=False):
+    @property
+    def max_allowed_packet(self):
+        """
+        :return: the largest statement in bytes that can be sent to the server, queried once per connection.
+        """
+        if self._max_allowed_packet is None:
+            server_limit = self.query('SELECT @@max_allowed_packet').fetchone()[0]
+            self._max_allowed_packet = min(server_limit, getattr(self._conn, 'max_allowed_packet', server_limit))
+        return self._max_allowed_packet
+
+    def table_modified(self, full_table_name):
+        """
+        Called before DataJoint inserts into or deletes from a table.  Invalidates the cached queries of the table
+        and, inside bulk_load, records the table for the check of its foreign keys.
+        :param full_table_name: in the form `database`.`table_name`
+        """
+        self.query_cache.invalidate(full_table_name)
+        if self._bulk_load_tables is not None:
+            self._bulk_load_tables.add(full_table_name)
+
+    def escape(self, value):
+        """
+        :param value: a value to be included in a query
+        :return: the SQL literal of value as the client would send it in query arguments
+        """
+        return self._conn.escape(value)
+
+    def query(self, query, args=(), as_dict=False, raw_numeric=False):
         """
         Execute the specified query and return the tuple generator (cursor).
 
@@ -113,13 +153,20 @@ class Connection:
         :param args: additional arguments for the client.cursor
         :param as_dict: If as_dict is set to True, the returned cursor objects returns
                         query results as dictionary.
+        :param raw_numeric: If True, the values of numeric fields are returned as the unparsed strings sent by the
+                        server so that the caller can convert whole columns at once.
         """
         cursor = client.cursors.DictCursor if as_dict else client.cursors.Cursor
         cur = self._conn.cursor(cursor=cursor)
 
         # Log the query
+        decoders = self._conn.decoders
         try:
             logger.debug("Executing SQL:" + query[0:300])
+            if raw_numeric:
+                self._conn.decoders = dict(decoders)
+                self._conn.decoders.update((field_type, client.converters.through)
+                                           for field_type in expression_types)
             cur.execute(query, args)
         except err.OperationalError as e:
             if 'MySQL server has gone away' in str(e) and config['database.reconnect']:
@@ -130,6 +177,8 @@ class Connection:
                 self.connect()
             else:
                 raise
+        finally:
+            self._conn.decoders = decoders
         return cur
 
     # ---------- transaction processing
@@ -160,6 +209,7 @@ class Connection:
         """
         self.query('ROLLBACK')
         self._in_transaction = False
+        self.query_cache.clear()  # cached results may include rolled-back writes
         logger.info("Transaction cancelled. Rolling back ...")
 
     def commit_transaction(self):
@@ -193,3 +243,61 @@ class Connection:
             raise
         else:
             self.commit_transaction()
+
+    # -------- context manager for bulk loads
+    @contextmanager
+    def bulk_load(self):
+        """
+        Context manager for loading large amounts of data, e.g. into fresh schemas.  Opens a transaction and turns
+        off the session's foreign key and unique checks so that InnoDB does not check each inserted row.  Before
+        the transaction is committed, the foreign keys of the tables modified by DataJoint inside the context, and
+        of their children, are checked with one outer join per foreign key.  Violations cancel the transaction.
+        Unique secondary indexes are not checked again, so the loaded data must not duplicate their values.
+
+        Example:
+        >>> with dj.conn().bulk_load():
+        >>>     Session().insert(sessions)
+        >>>     Session.Trial().insert(trials)
+
+        :raise DataJointError: if rows reference missing parent rows
+        """
+        saved = self.query('SELECT @@foreign_key_checks, @@unique_checks').fetchone()
+        self.query('SET foreign_key_checks=0, unique_checks=0')
+        self._bulk_load_tables = set()
+        try:
+            with self.transaction:
+                yield self
+                self._check_foreign_keys(self._bulk_load_tables)
+        finally:
+            self._bulk_load_tables = None
+            self.query('SET foreign_key_checks={0}, unique_checks={1}'.format(*saved))
+
+    def _check_foreign_keys(self, tables):
+        """
+        :param tables: full names of the modified tables
+        :raise DataJointError: if a foreign key into or out of any of the tables is violated
+        """
+        tables = [table for table in tables if not table.split('.')[1].startswith('`~')]  # skip service tables
+        self.dependencies.load()
+        for table in tables:
+            self.dependencies.add_table(table)
+        edges = set(itertools.chain.from_iterable(
+            itertools.chain(self.dependencies.in_edges(table), self.dependencies.out_edges(table))
+            for table in tables))
+        violations = []
+        for parent, child in sorted(edges):
+            for foreign_key in self.dependencies[parent][child]['foreign_keys']:
+                # as in InnoDB, rows with a NULL in the foreign key do not reference the parent
+                count = self.query(
+                    'SELECT COUNT(*) FROM {child} AS `_child` LEFT JOIN {parent} AS `_parent` ON {on} '
+                    'WHERE `_parent`.`{first}` IS NULL AND {not_null}'.format(
+                        child=child, parent=parent, first=foreign_key[0][1],
+                        on=' AND '.join('`_child`.`{0}`=`_parent`.`{1}`'.format(*pair) for pair in foreign_key),
+                        not_null=' AND '.join('`_child`.`{0}` IS NOT NULL'.format(attr) for attr, _ in foreign_key))
+                ).fetchone()[0]
+                if count:
+                    violations.append(
+                        '{count} rows of {child} reference missing rows of {parent} through ({attrs})'.format(
+                            count=count, child=child, parent=parent, attrs=', '.join(attr for attr, _ in foreign_key)))
+        if violations:
+            raise DataJointError('Foreign keys were violated during the bulk load: ' + '; '.join(violations))
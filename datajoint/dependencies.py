@@ -56,8 +56,14 @@ class Dependencies(nx.DiGraph):
             except pp.ParseException:
                 pass
             else:
+                attributes = [r.strip('` ') for r in result.attributes.split(',')]
+                referenced_attributes = [r.strip('` ') for r in result.referenced_attributes.split(',')]
+                # several foreign keys between the same tables share one edge, which lists all of them
+                foreign_keys = self.get_edge_data(result.referenced_table, table_name, default={}).get(
+                    'foreign_keys', [])
                 self.add_edge(result.referenced_table, table_name,
-                              primary=all(r.strip('` ') in primary_key for r in result.attributes.split(',')))
+                              primary=all(r in primary_key for r in attributes),
+                              foreign_keys=foreign_keys + [list(zip(attributes, referenced_attributes))])
 
     def load(self, target=None):
         """
@@ -1,12 +1,175 @@
 from collections import OrderedDict
-from collections.abc import Callable, Iterable
+from collections.abc import Callable, Iterable, MutableMapping
+from decimal import Decimal
 import numpy as np
 import warnings
+from pymysql.converters import escape_item
+from pymysql.constants import FIELD_TYPE
 from .blob import unpack
-from . import DataJointError
+from .heading import expression_types
+from . import DataJointError, config
 from . import key as PRIMARY_KEY
 
 
+_deleted = object()   # marks the values of attributes deleted from a Row
+
+
+class Row(MutableMapping):
+    """
+    A fetched tuple presented as a mapping from attribute names to values.  All rows of one fetch share the
+    mapping from names to positions so that each row only stores its list of values.  Rows can be modified like
+    dicts; attributes added to a row are kept in a separate dict of that row.
+
+    :param index: dict mapping attribute names to positions in values, shared by the rows of a fetch
+    :param values: list of the values of the attributes in the order of index
+    """
+
+    __slots__ = ('_index', '_values', '_extra')
+
+    def __init__(self, index, values):
+        self._index = index
+        self._values = values
+        self._extra = None
+
+    def __getitem__(self, name):
+        i = self._index.get(name)
+        if i is not None and self._values[i] is not _deleted:
+            return self._values[i]
+        if self._extra is not None and name in self._extra:
+            return self._extra[name]
+        raise KeyError(name)
+
+    def __setitem__(self, name, value):
+        i = self._index.get(name)
+        if i is not None:
+            self._values[i] = value
+        else:
+            if self._extra is None:
+                self._extra = OrderedDict()
+            self._extra[name] = value
+
+    def __delitem__(self, name):
+        i = self._index.get(name)
+        if i is not None and self._values[i] is not _deleted:
+            self._values[i] = _deleted
+        elif self._extra is not None and name in self._extra:
+            del self._extra[name]
+        else:
+            raise KeyError(name)
+
+    def __iter__(self):
+        yield from (name for name, i in self._index.items() if self._values[i] is not _deleted)
+        if self._extra is not None:
+            yield from self._extra
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return '{%s}' % ', '.join('%r: %r' % item for item in self.items())
+
+    def __getstate__(self):
+        return OrderedDict(self.items())
+
+    def __setstate__(self, state):
+        self._index = {name: i for i, name in enumerate(state)}
+        self._values = list(state.values())
+        self._extra = None
+
+
+def row_maker(heading, unpack_blobs=True):
+    """
+    :param heading: the heading of the fetched relation
+    :param unpack_blobs: if True, blob attributes are unpacked
+    :return: a function that converts a cursor row, a dict or a tuple, into a Row with a key schema shared by all
+    rows that it makes
+    """
+    index = {name: i for i, name in enumerate(heading.names)}
+    do_unpack = [unpack_blobs and heading[name].is_blob for name in heading.names]
+
+    def make(values):
+        if isinstance(values, dict):
+            values = [values[name] for name in index]
+        return Row(index, [unpack(value) if up else value for up, value in zip(do_unpack, values)])
+    return make
+
+
+def _parse_cell(type_code, value):
+    """
+    :return: the Python value of an unparsed numeric value as the default pymysql converters would return it
+    """
+    if value is None:
+        return None
+    if isinstance(value, bytes):
+        value = value.decode()
+    if type_code in (FIELD_TYPE.DECIMAL, FIELD_TYPE.NEWDECIMAL):
+        return Decimal(value)
+    if type_code in (FIELD_TYPE.FLOAT, FIELD_TYPE.DOUBLE):
+        return float(value)
+    return int(value)
+
+
+def raw_numeric_array(rows, heading, description):
+    """
+    Converts rows fetched with raw_numeric=True, in which numeric values are unparsed strings, into a record array
+    with the dtypes of heading.as_dtype.  Each numeric column with a numeric dtype is parsed by a single numpy
+    conversion rather than value by value; NULLs in floating-point columns become NaN.
+    :param rows: sequence of tuples returned by the cursor
+    :param heading: the heading of the fetched relation
+    :param description: the cursor description of the query
+    :return: a record array
+    """
+    dtype = heading.as_dtype
+    ret = np.empty(len(rows), dtype=dtype)
+    columns = zip(*rows) if rows else ([] for _ in heading.names)
+    for name, (_, type_code, *_), column in zip(heading.names, description, columns):
+        if heading[name].is_blob:
+            ret[name] = list(map(unpack, column))
+        elif type_code not in expression_types:
+            ret[name] = column
+        elif dtype[name] == object:
+            ret[name] = [_parse_cell(type_code, value) for value in column]
+        else:
+            if dtype[name].kind == 'f' and None in column:
+                column = ['nan' if value is None else value.decode() if isinstance(value, bytes) else value
+                          for value in column]
+            ret[name] = np.array(column).astype(dtype[name])
+    return ret
+
+
+def compact_array(rows, heading, downcast=False):
+    """
+    Converts fetched rows into a record array with the compact dtypes of heading.as_compact_dtype.
+    Enums are converted into their integer codes, which index into heading[name].categories.
+    Date and time columns are converted as whole columns into datetime64 or timedelta64 with NULLs as NaT.
+    :param rows: sequence of tuples returned by the cursor
+    :param heading: the heading of the fetched relation
+    :param downcast: if True, double-precision floats are converted to single precision
+    :return: a record array or, if the heading has nullable attributes, a masked record array in which NULLs
+    are masked.
+    """
+    dtype = heading.as_compact_dtype(downcast)
+    ret = np.empty(len(rows), dtype=dtype)
+    mask = np.zeros(len(rows), dtype=np.ma.make_mask_descr(dtype))
+    columns = zip(*rows) if rows else ([] for _ in heading.names)
+    for name, column in zip(heading.names, columns):
+        attr = heading[name]
+        if attr.nullable:
+            mask[name] = [value is None for value in column]
+        if attr.categories is not None:
+            codes = {value: code for code, value in enumerate(attr.categories)}
+            column = [codes.get(value, -1) for value in column]
+        elif attr.is_blob:
+            column = [None if value is None else unpack(value) for value in column]
+        elif dtype[name].kind in 'mM':  # timedelta64 or datetime64
+            column = np.array(column, dtype=dtype[name])
+        elif attr.nullable and dtype[name] != object:
+            fill = '' if dtype[name].kind == 'U' else np.nan if dtype[name].kind == 'f' else 0
+            column = [fill if value is None else value for value in column]
+        ret[name] = column
+    return np.ma.array(ret, mask=mask) if any(heading[name].nullable for name in heading.names) else ret
+
+
 class FetchBase:
 
     @staticmethod
@@ -98,28 +261,55 @@ class Fetch(FetchBase, Callable, Iterable):
         :param offset: the number of tuples to skip in the returned result
         :param limit: the maximum number of tuples to return
         :param order_by: the list of attributes to order the results. No ordering should be assumed if order_by=None.
-        :param as_dict: returns a list of dictionaries instead of a record array
+        :param as_dict: returns a list of Rows, which are mappings like dicts, instead of a record array
+        :param compact: return a record array with compact dtypes: enums as integer codes, short strings as
+        fixed-width unicode, and nullable integers as integer fields of a masked array. See compact_array.
+        :param downcast: in compact mode, convert double-precision floats to single precision
+        :param raw_numeric: receive numeric values unparsed and convert each numeric column into numpy at once,
+        which is faster for wide numeric relations. Applies only to record arrays that are not compact.
+        :param max_bytes: refuse to fetch results estimated to be larger. Defaults to config['fetch.max_bytes'].
+        None allows fetches of any size.
         :return: the contents of the relation in the form of a structured numpy.array
         """
         behavior = dict(self.behavior, **kwargs)
         if behavior['limit'] is None and behavior['offset'] is not None:
             warnings.warn('Offset set, but no limit. Setting limit to a large number. '
                           'Consider setting a limit explicitly.')
-            behavior['limit'] = 2 * len(self._relation)
-        cur = self._relation.cursor(**behavior)
+            behavior['limit'] = 18446744073709551615  # the largest LIMIT in MySQL
+        max_bytes = behavior.get('max_bytes', config['fetch.max_bytes'])
+        if max_bytes is not None:
+            self._check_size(max_bytes, behavior['limit'])
+        raw_numeric = bool(behavior.get('raw_numeric')) and not (behavior['as_dict'] or behavior.get('compact'))
+        rows, description = self._relation.connection.query_cache.fetch(
+            self._relation.fetch_sql(behavior['offset'], behavior['limit'], behavior['order_by']),
+            self._relation, as_dict=behavior['as_dict'], raw_numeric=raw_numeric)
 
         heading = self._relation.heading
+        heading.infer_expression_dtypes(description)
         if behavior['as_dict']:
-            ret = [OrderedDict((name, unpack(d[name]) if heading[name].is_blob else d[name])
-                               for name in heading.names)
-                   for d in cur.fetchall()]
+            ret = list(map(row_maker(heading), rows))
+        elif behavior.get('compact'):
+            ret = compact_array(rows, heading, downcast=behavior.get('downcast', False))
+        elif raw_numeric:
+            ret = raw_numeric_array(rows, heading, description)
         else:
-            ret = np.array(list(cur.fetchall()), dtype=heading.as_dtype)
+            ret = np.array(list(rows), dtype=heading.as_dtype)
             for blob_name in heading.blobs:
                 ret[blob_name] = list(map(unpack, ret[blob_name]))
 
         return ret
 
+    def _check_size(self, max_bytes, limit=None):
+        """
+        :raise DataJointError: if the result of the fetch is estimated to exceed max_bytes
+        """
+        size = self._relation.estimate_bytes(limit)
+        if size > max_bytes:
+            raise DataJointError(
+                'The fetch result is estimated at {size:,} bytes, which exceeds the limit of {max_bytes:,} bytes. '
+                'Restrict the relation, project out blobs, set a limit, or call fetch(max_bytes=None) '
+                'to fetch it anyway.'.format(size=size, max_bytes=max_bytes))
+
     def __iter__(self):
         """
         Iterator that returns the contents of the database.
@@ -130,17 +320,42 @@ class Fetch(FetchBase, Callable, Iterable):
 
         heading = self._relation.heading
         do_unpack = tuple(h in heading.blobs for h in heading.names)
+        make_row = row_maker(heading)
         values = cur.fetchone()
         while values:
             if behavior['as_dict']:
-                yield OrderedDict(
-                    (field_name, unpack(values[field_name])) if up
-                    else (field_name, values[field_name])
-                    for field_name, up in zip(heading.names, do_unpack))
+                yield make_row(values)
             else:
                 yield tuple(unpack(value) if up else value for up, value in zip(do_unpack, values))
             values = cur.fetchone()
 
+    def pages(self, size):
+        """
+        Iterator that returns the contents of the relation in pages of at most `size` tuples ordered by the
+        primary key.  Each page is fetched by restricting the primary key to values following the last tuple of the
+        previous page rather than with OFFSET, so that every page takes the same time to fetch.
+        :param size: number of tuples per page
+        :return: pages in the form returned by fetch(): record arrays or lists of dicts
+
+        Example:
+        >>> for page in my_relation.fetch.pages(10000):
+        >>>     export(page)
+        """
+        relation = self._relation
+        primary_key = relation.primary_key
+        behavior = dict(self.behavior, offset=None, limit=size, order_by=['`%s`' % k for k in primary_key])
+        page = relation.fetch(**behavior)
+        while len(page):
+            yield page
+            if len(page) < size:
+                break
+            last = [page[-1][k] for k in primary_key]
+            last = [escape_item(v.item() if isinstance(v, np.generic) else v, 'utf8') for v in last]
+            page = (relation & ' OR '.join(
+                '(%s)' % ' AND '.join(['`%s`=%s' % (k, v) for k, v in zip(primary_key[:i], last)] +
+                                      ['`%s`>%s' % (primary_key[i], last[i])])
+                for i in range(len(primary_key)))).fetch(**behavior)
+
     def keys(self, **kwargs):
         """
         Iterator that returns primary keys as a sequence of dicts.
@@ -189,16 +404,15 @@ class Fetch1(FetchBase, Callable):
     def __call__(self):
         """
         This version of fetch is called when self is expected to contain exactly one tuple.
-        :return: the one tuple in the relation in the form of a dict
+        :return: the one tuple in the relation in the form of a Row, which is a mapping like a dict
         """
         heading = self._relation.heading
 
-        cur = self._relation.cursor(as_dict=True)
-        ret = cur.fetchone()
-        if not ret or cur.fetchone():
+        rows, _ = self._relation.connection.query_cache.fetch(
+            self._relation.fetch_sql(limit=2), self._relation, as_dict=True)  # two rows suffice to detect multiplicity
+        if len(rows) != 1:
             raise DataJointError('fetch1 should only be used for relations with exactly one tuple')
-        return OrderedDict((name, unpack(ret[name]) if heading[name].is_blob else ret[name])
-                           for name in heading.names)
+        return row_maker(heading)(rows[0])
 
     def __getitem__(self, item):
         """
@@ -212,9 +426,10 @@ class Fetch1(FetchBase, Callable):
         """
         single_output = isinstance(item, str) or item is PRIMARY_KEY or isinstance(item, int)
         item, attributes = self._prepare_attributes(item)
-        result = self._relation.proj(*attributes).fetch()
+        result = self._relation.proj(*attributes).fetch(limit=2)
         if len(result) != 1:
-            raise DataJointError('fetch1 should only return one tuple. %d tuples were found' % len(result))
+            raise DataJointError('fetch1 should only return one tuple. %s tuples were found' % (
+                'multiple' if len(result) else 'no'))
         return_values = tuple(
             (result[self._relation.primary_key].copy() if attribute is PRIMARY_KEY else result[attribute])[0]
             for attribute in item)
@@ -1,5 +1,6 @@
 import numpy as np
-from . import DataJointError
+from pymysql.constants import FIELD_TYPE
+from . import DataJointError, config
 from collections import namedtuple, OrderedDict
 import re
 
@@ -7,6 +8,50 @@ default_attribute_properties = dict(    # these default values are set in comput
     name=None, type='expression', in_key=False, nullable=False, default=None, comment='calculated attribute',
     autoincrement=False, numeric=None, string=None, is_blob=False, sql_expression=None, dtype=object)
 
+numeric_types = {
+    ('float', False): np.float32,
+    ('float', True): np.float32,
+    ('double', False): np.float32,
+    ('double', True): np.float64,
+    ('tinyint', False): np.int8,
+    ('tinyint', True): np.uint8,
+    ('smallint', False): np.int16,
+    ('smallint', True): np.uint16,
+    ('mediumint', False): np.int32,
+    ('mediumint', True): np.uint32,
+    ('int', False): np.int32,
+    ('int', True): np.uint32,
+    ('bigint', False): np.int64,
+    ('bigint', True): np.uint64
+    # TODO: include types DECIMAL and NUMERIC
+    }
+
+
+expression_types = {    # numeric MySQL field types and the dtypes of computed attributes: (not nullable, nullable)
+    FIELD_TYPE.TINY: (np.int64, object),
+    FIELD_TYPE.SHORT: (np.int64, object),
+    FIELD_TYPE.INT24: (np.int64, object),
+    FIELD_TYPE.LONG: (np.int64, object),
+    FIELD_TYPE.LONGLONG: (np.int64, object),
+    FIELD_TYPE.FLOAT: (np.float64, np.float64),
+    FIELD_TYPE.DOUBLE: (np.float64, np.float64),
+    FIELD_TYPE.DECIMAL: (np.float64, np.float64),
+    FIELD_TYPE.NEWDECIMAL: (np.float64, np.float64)
+    }
+
+
+def numeric_dtype(sql_type):
+    """
+    :param sql_type: the MySQL type of an integer or floating-point attribute
+    :return: the corresponding numpy dtype
+    """
+    is_unsigned = bool(re.search(r'\sunsigned', sql_type, flags=re.IGNORECASE))
+    t = sql_type
+    t = re.sub(r'\(.*\)', '', t)    # remove parentheses
+    t = re.sub(r' unsigned$', '', t)   # remove unsigned
+    assert (t, is_unsigned) in numeric_types, 'dtype not found for type %s' % t
+    return numeric_types[(t, is_unsigned)]
+
 
 class Attribute(namedtuple('_Attribute', default_attribute_properties.keys())):
     """
@@ -36,6 +81,41 @@ class Attribute(namedtuple('_Attribute', default_attribute_properties.keys())):
         return '`{name}` {type} {default} COMMENT "{comment}"'.format(
             name=self.name, type=self.type, default=default, comment=self.comment)
 
+    @property
+    def categories(self):
+        """
+        :return: for enum attributes, the tuple of enum values in the order of their integer codes in compact
+        fetches. None for other attributes.
+        """
+        if not re.match(r'enum\(', self.type, flags=re.IGNORECASE):
+            return None
+        return tuple(v.replace("''", "'") for v in re.findall(r"'((?:[^']|'')*)'", self.type))
+
+    def compact_dtype(self, downcast=False):
+        """
+        :param downcast: if True, double-precision floats are converted to single precision
+        :return: the numpy dtype of the attribute in compact fetches: enums are represented by their integer codes
+        (-1 for NULL or invalid values), strings of up to config['fetch.compact_string_length'] characters are
+        fixed-width unicode, nullable integers have their numeric dtype, dates and times are datetime64, and
+        time intervals are timedelta64, in microseconds if the type has fractional seconds.
+        """
+        if self.is_blob or self.type == 'expression':
+            return self.dtype
+        if self.categories is not None:
+            return np.int8 if len(self.categories) < 128 else np.int16
+        match = re.match(r'(?P<type>date|datetime|timestamp|time)(\((?P<fsp>\d+)\))?$', self.type)
+        if match:
+            unit = 'D' if match.group('type') == 'date' else 'us' if int(match.group('fsp') or 0) else 's'
+            return np.dtype(('timedelta64[%s]' if match.group('type') == 'time' else 'datetime64[%s]') % unit)
+        match = re.match(r'(var)?char\((?P<length>\d+)\)', self.type)
+        if match and int(match.group('length')) <= config['fetch.compact_string_length']:
+            return np.dtype('U%s' % match.group('length'))
+        if self.dtype is object and re.match(r'(tiny|small|medium|big)?int', self.type):
+            return numeric_dtype(self.type)
+        if downcast and self.dtype == np.float64:
+            return np.float32
+        return self.dtype
+
 
 class Heading:
     """
@@ -107,6 +187,26 @@ class Heading:
             names=self.names,
             formats=[v.dtype for v in self.attributes.values()]))
 
+    def infer_expression_dtypes(self, description):
+        """
+        Sets the dtypes of computed attributes from the MySQL field types of a query of this heading, e.g. int64 for
+        count(*) and float64 for avg(x).  Nullable integer results remain objects and NULL floats become NaN.
+        :param description: the cursor description of the query
+        """
+        for name, type_code, *_, null_ok in description:
+            attr = self.attributes.get(name)
+            if (attr is not None and attr.type == 'expression' and attr.dtype is object and
+                    type_code in expression_types):
+                self.attributes[name] = attr._replace(dtype=expression_types[type_code][bool(null_ok)])
+
+    def as_compact_dtype(self, downcast=False):
+        """
+        represent the heading as the numpy dtype of compact fetches. See Attribute.compact_dtype.
+        """
+        return np.dtype(dict(
+            names=self.names,
+            formats=[v.compact_dtype(downcast) for v in self.attributes.values()]))
+
     @property
     def as_sql(self):
         """
@@ -151,24 +251,6 @@ class Heading:
                        for k, v in x.items() if k not in fields_to_drop}
                       for x in attributes]
 
-        numeric_types = {
-            ('float', False): np.float32,
-            ('float', True): np.float32,
-            ('double', False): np.float32,
-            ('double', True): np.float64,
-            ('tinyint', False): np.int8,
-            ('tinyint', True): np.uint8,
-            ('smallint', False): np.int16,
-            ('smallint', True): np.uint16,
-            ('mediumint', False): np.int32,
-            ('mediumint', True): np.uint32,
-            ('int', False): np.int32,
-            ('int', True): np.uint32,
-            ('bigint', False): np.int64,
-            ('bigint', True): np.uint64
-            # TODO: include types DECIMAL and NUMERIC
-            }
-
         # additional attribute properties
         for attr in attributes:
             attr['nullable'] = (attr['nullable'] == 'YES')
@@ -190,12 +272,7 @@ class Heading:
                 is_integer = bool(re.match(r'(tiny|small|medium|big)?int', attr['type']))
                 is_float = bool(re.match(r'(double|float)', attr['type']))
                 if is_integer and not attr['nullable'] or is_float:
-                    is_unsigned = bool(re.match('\sunsigned', attr['type'], flags=re.IGNORECASE))
-                    t = attr['type']
-                    t = re.sub(r'\(.*\)', '', t)    # remove parentheses
-                    t = re.sub(r' unsigned$', '', t)   # remove unsigned
-                    assert (t, is_unsigned) in numeric_types, 'dtype not found for type %s' % t
-                    attr['dtype'] = numeric_types[(t, is_unsigned)]
+                    attr['dtype'] = numeric_dtype(attr['type'])
         self.attributes = OrderedDict([(q['name'], Attribute(**q)) for q in attributes])
 
     def project(self, attribute_list, named_attributes, force_primary_key=None):
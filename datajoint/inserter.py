@@ -0,0 +1,156 @@
+"""
+This module hosts the AsyncInserter class and the async_inserter context manager, which insert rows into a table
+from a background thread so that producing the rows and sending them to the database overlap.
+"""
+import logging
+import queue
+import threading
+from contextlib import contextmanager
+from . import config, DataJointError
+from .connection import Connection
+from .base_relation import FreeRelation
+
+logger = logging.getLogger(__name__)
+
+
+class _Marker:
+    """
+    Queued after rows to wait until the background thread has inserted them.
+    """
+    def __init__(self, stop=False):
+        self.stop = stop
+        self.done = threading.Event()
+
+
+class AsyncInserter:
+    """
+    Inserts rows into a table from a background thread with its own connection.  Rows are accepted through a
+    bounded queue, so insert1 and insert only block when the background thread falls behind by more than
+    config['insert.queue_size'] rows.  Queued rows are inserted in batches of up to config['insert.max_rows'].
+
+    The query cache of the relation's connection is invalidated for the table by flush and close, so cached
+    results may not include rows inserted since the last flush.
+    An error raised by a background insert is raised again by the next call to insert1, insert, flush, or close.
+    Rows queued after the error are discarded.  Rows must not be modified after they are queued.
+
+    :param relation: the base relation to insert into
+    :param insert_options: keyword arguments passed to relation.insert, e.g. skip_duplicates=True
+    """
+
+    def __init__(self, relation, **insert_options):
+        self.full_table_name = relation.full_table_name
+        self._query_cache = relation.connection.query_cache
+        self._insert_options = insert_options
+        self._batch_size = config['insert.max_rows']
+        self._queue = queue.Queue(maxsize=config['insert.queue_size'])
+        self._error = None
+        self._error_raised = False
+        info = relation.connection.conn_info
+        self._connection = Connection('{host}:{port}'.format(**info), info['user'], info['passwd'],
+                                      relation.connection.init_fun)
+        self._relation = FreeRelation(self._connection, self.full_table_name)
+        self._relation._heading = relation.heading
+        self._thread = threading.Thread(target=self._run, name='insert ' + self.full_table_name, daemon=True)
+        self._thread.start()
+
+    def insert1(self, row):
+        """
+        Queues one row for insertion.
+        :param row: a valid argument of BaseRelation.insert1
+        """
+        self._raise_error()
+        if not self._thread.is_alive():
+            raise DataJointError('The inserter into %s is closed.' % self.full_table_name)
+        self._queue.put(row)
+
+    def insert(self, rows):
+        """
+        Queues rows for insertion.
+        :param rows: an iterable of valid arguments of BaseRelation.insert1
+        """
+        for row in rows:
+            self.insert1(row)
+
+    def flush(self):
+        """
+        Waits until all queued rows are inserted.
+        :raise: the error of a failed background insert
+        """
+        self._raise_error()
+        if not self._thread.is_alive():
+            raise DataJointError('The inserter into %s is closed.' % self.full_table_name)
+        self._wait(_Marker())
+        self._query_cache.invalidate(self.full_table_name)
+        self._raise_error()
+
+    def close(self):
+        """
+        Inserts the queued rows, stops the background thread, and closes its connection.
+        :raise: the error of a failed background insert
+        """
+        if self._thread.is_alive():
+            self._wait(_Marker(stop=True))
+            self._thread.join()
+            self._connection.close()
+            self._query_cache.invalidate(self.full_table_name)
+        self._raise_error()
+
+    def _wait(self, marker):
+        self._queue.put(marker)
+        marker.done.wait()
+
+    def _raise_error(self):
+        if self._error is not None and not self._error_raised:
+            self._error_raised = True
+            raise self._error
+        if self._error_raised:
+            raise DataJointError('A background insert into %s has failed.' % self.full_table_name)
+
+    def _run(self):
+        batch = []
+        while True:
+            item = self._queue.get()
+            if not isinstance(item, _Marker):
+                batch.append(item)
+                if len(batch) < self._batch_size and not self._queue.empty():
+                    continue  # keep collecting the rows that are already waiting
+            self._write(batch)
+            batch = []
+            if isinstance(item, _Marker):
+                item.done.set()
+                if item.stop:
+                    return
+
+    def _write(self, batch):
+        if batch and self._error is None:
+            try:
+                self._relation.insert(batch, **self._insert_options)
+            except Exception as error:
+                logger.error('Background insert into %s failed: %s' % (self.full_table_name, error))
+                self._error = error
+
+
+@contextmanager
+def async_inserter(relation, **insert_options):
+    """
+    Context manager that yields an AsyncInserter for relation.  On exit, the queued rows are inserted and the
+    error of a failed background insert is raised unless the with block raised an error of its own.
+    :param relation: the base relation to insert into
+    :param insert_options: keyword arguments passed to relation.insert, e.g. skip_duplicates=True
+
+    Example:
+    >>> with dj.async_inserter(Recording()) as inserter:
+    >>>     for row in acquire():
+    >>>         inserter.insert1(row)
+    """
+    inserter = AsyncInserter(relation, **insert_options)
+    try:
+        yield inserter
+    except:
+        try:
+            inserter.close()
+        except Exception:
+            pass  # the error of the with block takes precedence
+        raise
+    else:
+        inserter.close()
@@ -1,13 +1,37 @@
 import collections
 import logging
+import json
 import numpy as np
 import re
 import datetime
+import threading
+from contextlib import contextmanager
+from pymysql import err
 from . import DataJointError, config
-from .fetch import Fetch, Fetch1
+from .fetch import Fetch, Fetch1, row_maker
+from .blob import unpack
 
 logger = logging.getLogger(__name__)
 
+_compilation = threading.local()   # state of the SQL statement being compiled in the current thread
+
+
+@contextmanager
+def compilation_scope():
+    """
+    Context for compiling one SQL statement. Subquery aliases are numbered in the order in which the subqueries
+    are rendered within the outermost scope. Therefore, the same expression always compiles into the same SQL
+    text, and concurrent compilations in different threads do not interfere.
+    """
+    depth = getattr(_compilation, 'depth', 0)
+    if not depth:
+        _compilation.subquery_count = 0
+    _compilation.depth = depth + 1
+    try:
+        yield
+    finally:
+        _compilation.depth = depth
+
 
 def equal_ignore_case(str1, str2):
     try:
@@ -28,10 +52,11 @@ def restricts_to_empty(arg):
     """
     returns True if restriction with arg must produce the empty relation.
     """
-    or_lists = (list, set, tuple, np.ndarray, RelationalOperand)
+    or_lists = (list, set, tuple, np.ndarray)
     return (arg is None or (isinstance(arg, AndList) and any(restricts_to_empty(r) for r in arg)) or
             arg is None or arg is False or equal_ignore_case(arg, "FALSE") or
             isinstance(arg, or_lists) and len(arg) == 0 or  # empty OR-list equals FALSE
+            isinstance(arg, RelationalOperand) and not arg or
             isinstance(arg, Not) and restricts_to_same(arg.restriction))
 
 
@@ -135,6 +160,13 @@ class RelationalOperand:
                 common_attributes = [q for q in self.heading.names if q in arg.heading.names]
                 if not common_attributes:
                     condition = 'FALSE' if _negate else 'TRUE'
+                elif self.semijoin_strategy(arg, common_attributes, _negate) == 'exists':
+                    condition = '{not_}exists (SELECT 1 FROM ({subquery}) as `_m` WHERE {match})'.format(
+                        not_="not " if _negate else "",
+                        subquery=arg.make_sql(','.join(
+                            '%s as `_%s`' % (arg.heading[q].sql_expression or '`%s`' % q, q)
+                            for q in common_attributes)),
+                        match=' AND '.join('`_m`.`_{0}`=`{0}`'.format(q) for q in common_attributes))
                 else:
                     common_attributes = '`' + '`,`'.join(common_attributes) + '`'
                     condition = '({fields}) {not_}in ({subquery})'.format(
@@ -175,6 +207,28 @@ class RelationalOperand:
             conditions.append(('NOT (%s)' if negate else '(%s)') % item)
         return ' WHERE ' + ' AND '.join(conditions)
 
+    def semijoin_strategy(self, other, attributes, negate=False):
+        """
+        Selects the SQL form of a semijoin (rel & other) or antijoin (rel - other) restriction of self.
+        config['query.semijoin'] may be 'in' (the default), 'exists', or 'auto'.  The forms differ in results when
+        a common attribute is NULL: NOT IN excludes the tuple from the antijoin whereas NOT EXISTS keeps it.
+        In 'auto' mode, antijoins are compiled as NOT EXISTS only when the common attributes are not nullable
+        in either relation, so that the choice does not affect results.  Semijoins are always compiled as
+        IN (subquery), which MySQL 5.6+ optimizes into a join.
+        :param other: the restricting relation
+        :param attributes: the names of the common attributes
+        :param negate: True for the antijoin
+        :return: 'in' or 'exists'
+        """
+        strategy = config['query.semijoin']
+        if strategy == 'auto':
+            strategy = 'exists' if negate and not any(
+                self.heading[name].nullable or other.heading[name].nullable for name in attributes) else 'in'
+        if isinstance(self, GroupBy):
+            strategy = 'in'  # the HAVING clause cannot be correlated with an EXISTS subquery
+        logger.debug('%s strategy: %s' % ('antijoin' if negate else 'semijoin', strategy))
+        return strategy
+
     @property
     def select_fields(self):
         """
@@ -316,6 +370,73 @@ class RelationalOperand:
     def fetch(self):
         return Fetch(self)
 
+    def fetch_many(self, keys, as_dict=False):
+        """
+        Fetches the tuples matching each of the keys with one query per config['fetch.batch_size'] keys rather than
+        one query per key.  The keys are inserted into a temporary table with the types of the relation's
+        attributes and joined with the relation on the server, so tuples match their keys by the server's rules as
+        in (relation & key).fetch(), e.g. in case-insensitive collations.
+        :param keys: a sequence of keys: dicts or elements of a record array with the same attributes.
+        :param as_dict: if True, the tuples are returned as Rows rather than as record arrays.
+        :return: a list with one entry per key, in the order of keys: the tuples matching the key in the form
+        returned by fetch().
+
+        Example:
+        >>> for key, channels in zip(keys, Channel().fetch_many(keys)):
+        >>>     process(key, channels)
+        """
+        def literal(value):
+            if isinstance(value, np.generic):
+                value = value.item()
+            return self.connection.escape(
+                str(value) if isinstance(value, (datetime.date, datetime.datetime, datetime.time)) else value)
+
+        keys = list(keys)
+        if not keys:
+            return []
+        heading = self.heading
+        names = [name for name in (keys[0].dtype.names if isinstance(keys[0], np.void) else keys[0].keys())
+                 if name in heading.names]
+        key_table = '`{database}`.`~fetch_many`'.format(
+            database=sorted(self.source_tables)[0].split('.')[0].strip('`'))
+        with compilation_scope():
+            relation = self.make_sql()
+        # the keys table takes the types and collations of the key attributes from the relation
+        self.connection.query(
+            'CREATE TEMPORARY TABLE {keys} SELECT 0 as `_position`{fields} FROM ({relation}) as `_rel` LIMIT 0'.format(
+                keys=key_table, fields=''.join(',`%s`' % name for name in names), relation=relation))
+        try:
+            ret = []
+            batch_size = config['fetch.batch_size']
+            for start in range(0, len(keys), batch_size):
+                batch = keys[start:start + batch_size]
+                self.connection.query('INSERT INTO {keys} VALUES {rows}'.format(
+                    keys=key_table, rows=','.join(
+                        '(' + ','.join(['%d' % position] + [literal(key[name]) for name in names]) + ')'
+                        for position, key in enumerate(batch))), args=None)  # the literals may contain %
+                cur = self.connection.query(
+                    'SELECT `_keys`.`_position`, `_rel`.* FROM ({relation}) as `_rel` JOIN {keys} as `_keys` '
+                    'ON {match}'.format(relation=relation, keys=key_table, match=' AND '.join(
+                        '`_rel`.`{0}`=`_keys`.`{0}`'.format(name) for name in names) or 'TRUE'))
+                rows = cur.fetchall()
+                self.connection.query('DELETE FROM ' + key_table)
+                heading.infer_expression_dtypes(cur.description[1:])
+                groups = collections.defaultdict(list)
+                for row in rows:
+                    groups[row[0]].append(row[1:])
+                if as_dict:
+                    make_row = row_maker(heading)
+                    ret.extend([make_row(row) for row in groups[position]] for position in range(len(batch)))
+                else:
+                    for position in range(len(batch)):
+                        tuples = np.array(groups[position], dtype=heading.as_dtype)
+                        for blob_name in heading.blobs:
+                            tuples[blob_name] = list(map(unpack, tuples[blob_name]))
+                        ret.append(tuples)
+        finally:
+            self.connection.query('DROP TEMPORARY TABLE IF EXISTS ' + key_table)
+        return ret
+
     def attributes_in_restriction(self):
         """
         :return: list of attributes that are probably used in the restrictions.
@@ -326,17 +447,99 @@ class RelationalOperand:
         return set(name for name in self.heading.names
                    if re.search(r'\b' + name + r'\b', self.where_clause))
 
+    def _walk(self, role='query', restrictions=True):
+        """
+        Generates the pairs (operand, role) for self and for all the operands in its expression tree, including
+        the relations used in semijoin and antijoin restrictions.
+        :param role: the role of self in the enclosing expression, e.g. 'Join', 'Projection', 'semijoin'.
+        :param restrictions: if False, the relations used in restrictions are skipped.
+        """
+        def restricting_relations(restriction, negate=False):
+            if isinstance(restriction, Not):
+                yield from restricting_relations(restriction.restriction, not negate)
+            elif isinstance(restriction, RelationalOperand):
+                yield restriction, 'antijoin' if negate else 'semijoin'
+            elif isinstance(restriction, (list, tuple, set)):
+                for item in restriction:
+                    yield from restricting_relations(item, negate)
+
+        yield self, role
+        for arg in (getattr(self, '_arg', None), getattr(self, '_arg2', None)):
+            if isinstance(arg, RelationalOperand):
+                yield from arg._walk(self.__class__.__name__, restrictions)
+        if restrictions:
+            for relation, relation_role in restricting_relations(self.restrictions):
+                yield from relation._walk(relation_role)
+
+    @property
+    def source_tables(self):
+        """
+        :return: the set of full names of the base tables that the query of the relation reads from
+        """
+        return set(operand.full_table_name for operand, _ in self._walk() if hasattr(operand, 'full_table_name'))
+
+    def explain(self):
+        """
+        Runs EXPLAIN on the SQL query of the relation and flags the steps of the plan that are likely to be slow:
+        full table scans, temporary tables, filesorts, and dependent subqueries.
+        :return: a dict with the keys
+            'sql': the explained query,
+            'plan': the rows of EXPLAIN as dicts, each extended with 'operator', 'relation', and 'warnings',
+            'json': the parsed output of EXPLAIN FORMAT=JSON or None if the server does not support it,
+            'warnings': the list of flagged steps, each mapped to the relational operator that caused it.
+        """
+        sql = self.make_sql()
+        operators = {}
+        for operand, role in self._walk():
+            if hasattr(operand, 'full_table_name'):
+                operators.setdefault(operand.table_name, (role, operand.full_table_name))
+        plan = list(self.connection.query('EXPLAIN ' + sql, as_dict=True).fetchall())
+        try:
+            plan_json = json.loads(self.connection.query('EXPLAIN FORMAT=JSON ' + sql).fetchone()[0])
+        except err.ProgrammingError:
+            plan_json = None  # MySQL versions before 5.6
+        warnings = []
+        for step in plan:
+            extra = step.get('Extra') or ''
+            step['operator'], step['relation'] = operators.get(step['table'], ('Subquery', None))
+            step['warnings'] = [flag for flag, condition in (
+                ('full table scan', step['type'] == 'ALL'),
+                ('temporary table', 'Using temporary' in extra),
+                ('filesort', 'Using filesort' in extra),
+                ('dependent subquery', step['select_type'].startswith('DEPENDENT'))) if condition]
+            warnings.extend('{flag} on {table} ({operator})'.format(
+                flag=flag, table=step['relation'] or step['table'], operator=step['operator'])
+                for flag in step['warnings'])
+        return dict(sql=sql, plan=plan, json=plan_json, warnings=warnings)
+
     def __repr__(self):
         return super().__repr__() if config['loglevel'].lower() == 'debug' else self.preview()
 
-    def preview(self):
+    def _fetch_preview(self):
         """
-        returns a preview of the contents of the relation.
+        Fetches the tuples displayed by preview() and _repr_html_() with one query of at most
+        config['display.limit'] + 1 tuples.  The total count is only queried when there are more tuples than
+        displayed, and that query is cut off after config['display.count_timeout'] milliseconds.
+        If config['display.estimated_counts'] is set, the count is estimated instead (see estimate_len).
+        :return: (relation with blobs projected out, tuples to display, True if not all tuples are displayed,
+        caption with the total count)
         """
         rel = self.proj(*self.heading.non_blobs)  # project out blobs
         limit = config['display.limit']
+        tuples = rel.fetch(limit=limit + 1)
+        if len(tuples) <= limit:
+            return rel, tuples, False, '%d' % len(tuples)
+        if config['display.estimated_counts']:
+            return rel, tuples[:limit], True, '~%d' % max(rel.estimate_len(), limit + 1)
+        count = rel._count(timeout=config['display.count_timeout'])
+        return rel, tuples[:limit], True, 'more than %d' % limit if count is None else '%d' % count
+
+    def preview(self):
+        """
+        returns a preview of the contents of the relation.
+        """
         width = config['display.width']
-        tuples = rel.fetch(limit=limit)
+        rel, tuples, more, count = self._fetch_preview()
         columns = rel.heading.names
         widths = {f: min(max([len(f)] + [len(str(e)) for e in tuples[f]])+4, width) for f in columns}
         templates = {f: '%%-%d.%ds' % (widths[f], widths[f]) for f in columns}
@@ -344,11 +547,11 @@ class RelationalOperand:
             ' '.join([templates[f] % ('*'+f if f in rel.primary_key else f) for f in columns]) + '\n' +
             ' '.join(['+' + '-' * (widths[column] - 2) + '+' for column in columns]) + '\n' +
             '\n'.join(' '.join(templates[f] % tup[f] for f in columns) for tup in tuples) +
-            ('\n...\n' if len(rel) > limit else '\n') +
-            ' (%d tuples)\n' % len(rel))
+            ('\n...\n' if more else '\n') +
+            ' (%s tuples)\n' % count)
 
     def _repr_html_(self):
-        rel = self.proj(*self.heading.non_blobs)  # project out blobs
+        rel, tuples, _, count = self._fetch_preview()
         info = self.heading.table_info
         return """ {title}
             <div style="max-height:1000px;max-width:1500px;overflow:auto;">
@@ -363,40 +566,89 @@ class RelationalOperand:
                                   for c in rel.heading.names),
             body='</tr><tr>'.join(
                 ['\n'.join(['<td>%s</td>' % column for column in tup])
-                 for tup in rel.fetch(limit=config['display.limit'])]),
-            count=len(rel))
+                 for tup in tuples]),
+            count=count)
 
     def make_sql(self, select_fields=None):
-        return 'SELECT {fields} FROM {from_}{where}'.format(
-            fields=(select_fields if select_fields else ("DISTINCT " if self.distinct else "") + self.select_fields),
-            from_=self.from_clause,
-            where=self.where_clause)
+        with compilation_scope():
+            return 'SELECT {fields} FROM {from_}{where}'.format(
+                fields=(select_fields if select_fields else ("DISTINCT " if self.distinct else "") + self.select_fields),
+                from_=self.from_clause,
+                where=self.where_clause)
+
+    def estimate_bytes(self, limit=None):
+        """
+        :param limit: the maximum number of tuples fetched
+        :return: an estimate of the size of the relation's contents in bytes from estimate_len() and the
+        average row lengths reported by SHOW TABLE STATUS for the base tables that contribute attributes.
+        Tables whose blobs are all projected out are counted at 8 bytes per remaining attribute.
+        """
+        row_bytes = 0
+        for operand, _ in self._walk(restrictions=False):
+            info = operand.heading.table_info if hasattr(operand, 'full_table_name') else None
+            if info is not None:
+                attributes = [name for name in operand.heading.names if name in self.heading.names]
+                blobs = operand.heading.blobs
+                row_bytes += ((info['avg_row_length'] or 0) if not blobs or set(blobs) & set(attributes)
+                              else 8 * len(attributes))
+        rows = self.estimate_len()
+        return row_bytes * (rows if limit is None else min(rows, limit))
+
+    def _count_sql(self):
+        return self.make_sql('count(%s)' % (
+            ("DISTINCT `%s`" % '`,`'.join(self.primary_key)) if self.distinct else "*"))
+
+    def _count(self, timeout=None):
+        """
+        :param timeout: if not None, the query is interrupted after timeout milliseconds (MySQL 5.7.8+)
+        :return: number of tuples in the relation or None if the query was interrupted
+        """
+        sql = self._count_sql()
+        if timeout is not None:
+            sql = re.sub(r'^SELECT', 'SELECT /*+ MAX_EXECUTION_TIME(%d) */' % timeout, sql)
+        try:
+            return self.connection.query(sql).fetchone()[0]
+        except err.OperationalError as e:
+            if timeout is None or e.args[0] != 3024:   # ER_QUERY_TIMEOUT
+                raise
+            return None
 
     def __len__(self):
         """
         number of tuples in the relation.
         """
-        return self.connection.query(self.make_sql('count(%s)' % (
-            ("DISTINCT `%s`" % '`,`'.join(self.primary_key)) if self.distinct else "*"))).fetchone()[0]
+        return self._count()
+
+    def estimate_len(self):
+        """
+        :return: an estimate of the number of tuples in the relation from the row estimates of EXPLAIN.
+        The estimate does not require counting the tuples and can be far off, especially for aggregations.
+        """
+        plan = self.connection.query('EXPLAIN ' + self.make_sql(), as_dict=True).fetchall()
+        steps = [step for step in plan if step['id'] == 1 and step['rows'] is not None]  # the outermost SELECT
+        estimate = 0 if not steps else 1
+        for step in steps:
+            estimate *= step['rows'] * float(step.get('filtered') or 100) / 100
+        return int(round(estimate))
 
     def __bool__(self):
         """
-        :return:  True if the relation is not empty. Equivalent to len(rel)>0 but may be more efficient.
+        :return:  True if the relation is not empty. Equivalent to len(rel)>0 but stops at the first tuple found.
         """
-        return len(self) > 0
+        return bool(self.connection.query('SELECT EXISTS(%s)' % self.make_sql()).fetchone()[0])
 
     def __contains__(self, item):
         """
         returns True if item is found in the relation.
         :param item: any restriction
-        (item in relation) is equivalent to bool(self & item) but may be executed more efficiently.
+        (item in relation) is equivalent to bool(self & item), which is executed as an EXISTS query.
         """
-        return bool(self & item)   # May be optimized e.g. using an EXISTS query
+        return bool(self & item)
 
-    def cursor(self, offset=0, limit=None, order_by=None, as_dict=False):
+    def fetch_sql(self, offset=0, limit=None, order_by=None):
         """
         See Relation.fetch() for input description.
-        :return: query cursor
+        :return: the SQL query issued by fetch
         """
         if offset and limit is None:
             raise DataJointError('limit is required when offset is set')
@@ -406,7 +658,14 @@ class RelationalOperand:
         if limit is not None:
             sql += ' LIMIT %d' % limit + (' OFFSET %d' % offset if offset else "")
         logger.debug(sql)
-        return self.connection.query(sql, as_dict=as_dict)
+        return sql
+
+    def cursor(self, offset=0, limit=None, order_by=None, as_dict=False):
+        """
+        See Relation.fetch() for input description.
+        :return: query cursor
+        """
+        return self.connection.query(self.fetch_sql(offset, limit, order_by), as_dict=as_dict)
 
 
 class Not:
@@ -556,15 +815,16 @@ class GroupBy(RelationalOperand):
             attributes, named_attributes, force_primary_key=arg.primary_key)
 
     def make_sql(self):
-        return 'SELECT {fields} FROM {from_}{where} GROUP  BY `{group_by}`{having}'.format(
-            fields=self.select_fields,
-            from_=self._arg.from_clause,
-            where=self._arg.where_clause,
-            group_by='`,`'.join(self.primary_key),
-            having=re.sub(r'^ WHERE', ' HAVING', self.where_clause))
+        with compilation_scope():
+            return 'SELECT {fields} FROM {from_}{where} GROUP  BY `{group_by}`{having}'.format(
+                fields=self.select_fields,
+                from_=self._arg.from_clause,
+                where=self._arg.where_clause,
+                group_by='`,`'.join(self.primary_key),
+                having=re.sub(r'^ WHERE', ' HAVING', self.where_clause))
 
-    def __len__(self):
-        return len(Subquery.make(self))
+    def _count_sql(self):
+        return Subquery.make(self)._count_sql()
 
 
 class Subquery(RelationalOperand):
@@ -572,8 +832,8 @@ class Subquery(RelationalOperand):
     A Subquery encapsulates its argument in a SELECT statement, enabling its use as a subquery.
     The attribute list and the WHERE clause are resolved.  Thus, a subquery no longer has any renamed attributes.
     A subquery of a subquery is a just a copy of the subquery with no change in SQL.
+    Subquery aliases are numbered by their position in the compiled statement (see compilation_scope).
     """
-    __counter = 0
 
     def __init__(self, arg=None):
         if arg is None:
@@ -597,14 +857,12 @@ class Subquery(RelationalOperand):
         self._arg = arg
         return self
 
-    @property
-    def counter(self):
-        Subquery.__counter += 1
-        return Subquery.__counter
-
     @property
     def from_clause(self):
-        return '(' + self._arg.make_sql() + ') as `_s%x`' % self.counter
+        with compilation_scope():
+            _compilation.subquery_count += 1
+            alias = _compilation.subquery_count
+            return '(' + self._arg.make_sql() + ') as `_s%x`' % alias
 
     @property
     def select_fields(self):
@@ -16,6 +16,7 @@ GLOBALCONFIG = '.datajoint_config.json'
 
 validators = collections.defaultdict(lambda: lambda value: True)
 validators['database.port'] = lambda a: isinstance(a, int)
+validators['query.semijoin'] = lambda a: a in ('auto', 'in', 'exists')
 
 Role = Enum('Role', 'manual lookup imported computed job')
 role_to_prefix = {
@@ -33,6 +34,7 @@ default = OrderedDict({
     'database.user': 'datajoint',
     'database.port': 3306,
     'database.reconnect': True,
+    'database.local_infile': False,
     #
     'connection.init_function': None,
     #
@@ -40,8 +42,24 @@ default = OrderedDict({
     #
     'safemode': True,
     #
+    'query.semijoin': 'in',
+    #
+    'cache.max_bytes': 0,
+    'cache.revalidate': 60,
+    #
+    'fetch.max_bytes': None,
+    'fetch.batch_size': 1000,
+    'fetch.compact_string_length': 64,
+    #
+    'insert.max_rows': 10000,
+    'insert.target_seconds': 1.0,
+    'insert.pack_threads': 4,
+    'insert.queue_size': 10000,
+    #
     'display.limit': 7,
-    'display.width': 14
+    'display.width': 14,
+    'display.count_timeout': 1000,
+    'display.estimated_counts': False
 })
 
 logger = logging.getLogger()
@@ -1,7 +1,9 @@
 
 
 import numpy as np
+import datajoint as dj
 from datajoint.blob import pack, unpack
+from datajoint.base_relation import pack_rows, pack_executor
 from numpy.testing import assert_array_equal, raises
 
 
@@ -31,3 +33,16 @@ def test_complex():
 
     x = np.int16(np.random.randn(1, 2, 3)) + 1j*np.int16(np.random.randn(1, 2, 3))
     assert_array_equal(x, unpack(pack(x)), "Arrays do not match!")
+
+
+def test_parallel_pack():
+    rows = [[i, np.random.randn(100, i + 1) if i % 3 else None] for i in range(50)]
+    serial = [pack(row[1]) if row[1] is not None else None for row in rows]
+    with dj.config(insert__pack_threads=4):
+        parallel = [row[1] for row in pack_rows([list(row) for row in rows], [1])]
+    assert serial == parallel, "Parallel packing does not match serial packing"
+    with dj.config(insert__pack_threads=4):
+        executor = pack_executor()
+    with dj.config(insert__pack_threads=2):
+        pack_executor()
+    assert executor.submit(pack, rows[1][1]).result() == serial[1], "Changing pack_threads shut down a pool in use"
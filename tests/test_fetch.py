@@ -1,6 +1,8 @@
 from operator import itemgetter, attrgetter
 import itertools
-from nose.tools import assert_true, raises
+from collections.abc import Mapping
+import datetime
+from nose.tools import assert_true, assert_raises, raises
 from numpy.testing import assert_array_equal, assert_equal
 import numpy as np
 import warnings
@@ -136,13 +138,13 @@ class TestFetch:
         """Test returns as dictionaries"""
         d = self.lang.fetch.as_dict()
         for dd in d:
-            assert_true(isinstance(dd, dict))
+            assert_true(isinstance(dd, Mapping))
 
     def test_asdict_with_call(self):
         """Test returns as dictionaries with call."""
         d = self.lang.fetch.as_dict()
         for dd in d:
-            assert_true(isinstance(dd, dict))
+            assert_true(isinstance(dd, Mapping))
 
     def test_offset(self):
         """Tests offset"""
@@ -173,3 +175,106 @@ class TestFetch:
     def test_fetch1_step3(self):
         """Tests whether fetch1 raises error"""
         self.lang.fetch1['name']
+
+    def test_query_cache(self):
+        """Tests caching of fetch results and their invalidation by inserts"""
+        cache = self.lang.connection.query_cache
+        cache.clear()
+        with dj.config(cache__max_bytes=1000000):  # takes effect on the existing connection
+            first = self.lang.fetch(order_by=['name', 'language'])
+            assert_equal(len(cache), 1, 'fetch result was not cached')
+            assert_array_equal(self.lang.fetch(order_by=['name', 'language']), first)
+            assert_equal(len(cache), 1, 'identical fetch was not served from the cache')
+            key = dict(name='Fabian', language='Klingon')
+            self.lang.insert1(key)
+            assert_equal(len(cache), 0, 'insert did not invalidate the cache')
+            assert_equal(len(self.lang.fetch()), len(first) + 1)
+            (self.lang & key).delete_quick()
+            assert_equal(len(cache), 0, 'delete did not invalidate the cache')
+        cache.clear()
+
+    def test_max_bytes(self):
+        """Tests refusing fetches that are estimated to exceed max_bytes"""
+        assert_true(self.subject.estimate_bytes() >= 0, 'the size of the table is not estimated')
+        with dj.config(fetch__max_bytes=-1):  # any estimate exceeds the limit
+            assert_raises(dj.DataJointError, self.subject.fetch)
+            assert_true(len(self.subject.fetch(max_bytes=None)) == len(self.subject), 'max_bytes override failed')
+
+    def test_pages(self):
+        """Tests keyset pagination"""
+        full = self.lang.fetch(order_by=['name', 'language'])
+        pages = list(self.lang.fetch.pages(4))
+        assert_equal([len(page) for page in pages], [4, 2])
+        assert_array_equal(np.concatenate(pages), full)
+        dict_pages = list(self.lang.fetch.as_dict.pages(3))
+        assert_equal([tuple(d.values()) for page in dict_pages for d in page], [tuple(r) for r in full])
+
+    def test_fetch_many(self):
+        """Tests batched fetches grouped by key"""
+        keys = [dict(name='Fabian'), dict(name='Nobody'), dict(name='Edgar'), dict(name='Fabian'), dict(name='fabian')]
+        with dj.config(fetch__batch_size=3):
+            results = self.lang.fetch_many(keys)
+        assert_equal(len(results), len(keys))
+        for key, result in zip(keys, results):
+            assert_array_equal(np.sort(result), np.sort((self.lang & key).fetch()))
+        assert_equal(len(self.lang.fetch_many([dict(name='50%off')])[0]), 0)  # literals are not %-formatted
+        keys = self.lang.proj().fetch()
+        results = self.lang.fetch_many(keys, as_dict=True)
+        assert_true(all(len(result) == 1 and result[0]['name'] == key['name'] and
+                        result[0]['language'] == key['language'] for key, result in zip(keys, results)))
+
+    def test_compact(self):
+        """Tests fetching with compact dtypes"""
+        full = self.subject.fetch(order_by=['subject_id'])
+        compact = self.subject.fetch(order_by=['subject_id'], compact=True)
+        categories = self.subject.heading['species'].categories
+        assert_equal(categories, ('mouse', 'monkey', 'human'))
+        assert_equal(compact.dtype['species'], np.int8)
+        assert_equal(compact.dtype['real_id'], np.dtype('U40'))
+        assert_equal(compact.dtype['subject_notes'], object)
+        assert_equal([categories[code] for code in compact['species']], list(full['species']))
+        assert_equal(list(compact['real_id']), list(full['real_id']))
+        assert_equal(compact.dtype['date_of_birth'], np.dtype('datetime64[D]'))
+        assert_array_equal(compact['date_of_birth'], np.array(list(full['date_of_birth']), dtype='datetime64[D]'))
+        assert_true(np.all(compact['date_of_birth'] < np.datetime64('2016-01-01')) ==
+                    all(d < datetime.date(2016, 1, 1) for d in full['date_of_birth']))
+
+    def test_unsigned_dtypes(self):
+        """Tests that unsigned integer attributes are fetched with unsigned dtypes"""
+        assert_equal(dj.heading.numeric_dtype('int(10) unsigned'), np.uint32)
+        assert_equal(dj.heading.numeric_dtype('int(11)'), np.int32)
+        assert_equal(schema.Ephys.Channel().heading['channel'].dtype, np.uint8)
+
+    def test_expression_dtypes(self):
+        """Tests that computed attributes are fetched with numeric dtypes"""
+        rel = dj.U('language').aggregate(self.lang, n='count(*)', m='avg(length(name))')
+        result = rel.fetch()
+        assert_equal(result.dtype['n'], np.int64)
+        assert_equal(result.dtype['m'], np.float64)
+        assert_equal(result['n'].sum(), len(self.lang))
+        result = self.subject.proj(third='subject_id/3').fetch(order_by=['subject_id'])
+        assert_equal(result.dtype['third'], np.float64)
+        assert_array_equal(np.round(result['third']), np.round(result['subject_id'] / 3))
+
+    def test_raw_numeric(self):
+        """Tests that fetching with raw_numeric returns the same result"""
+        for rel in (self.subject, schema.Trial(), dj.U('language').aggregate(self.lang, n='count(*)')):
+            order_by = rel.primary_key
+            expected = rel.fetch(order_by=order_by)
+            result = rel.fetch(order_by=order_by, raw_numeric=True)
+            assert_equal(result.dtype, expected.dtype)
+            for name in expected.dtype.names:
+                assert_array_equal(result[name], expected[name])
+
+    def test_rows(self):
+        """Tests the rows returned by as_dict fetches"""
+        rows = self.lang.fetch.as_dict(order_by=['name', 'language'])
+        assert_true(rows[0]._index is rows[-1]._index)
+        assert_equal(rows, [dict(zip(('name', 'language'), t)) for t in sorted(schema.Language.contents)])
+        row = rows[0]
+        assert_equal(len(self.lang & row), 1)
+        row['extra'] = 1
+        del row['language']
+        assert_equal(list(row), ['name', 'extra'])
+        assert_raises(KeyError, row.__getitem__, 'language')
+        assert_equal(len(self.lang & rows[1]), 1)
@@ -1,4 +1,5 @@
-from nose.tools import assert_equal
+from nose.tools import assert_equal, assert_raises
+import datajoint as dj
 
 from . import schema_advanced
 
@@ -11,3 +12,14 @@ def test_aliased_fk():
     parents = person*parent*person.proj(parent_name='full_name', parent='person_id')
     parents &= dict(full_name="May K. Hall")
     assert_equal(set(parents.fetch['parent_name']), {'Hanna R. Walters', 'Russel S. James'})
+
+
+def test_bulk_load_aliased_fk():
+    parent = schema_advanced.Parent()
+
+    def load_orphan():
+        with parent.connection.bulk_load():
+            parent.insert1(dict(person_id=15, parent_sex='F', parent=99))  # fill() creates no parents of 15
+
+    assert_raises(dj.DataJointError, load_orphan)
+    assert_equal(len(parent & dict(parent=99)), 0)
@@ -1,6 +1,7 @@
 import numpy as np
 from nose.tools import assert_true
 import datajoint as dj
+from datajoint.base_relation import FreeRelation
 from . import PREFIX, CONN_INFO
 
 schema = dj.schema(PREFIX + '_nantest', locals(), connection=dj.conn(**CONN_INFO))
@@ -35,3 +36,13 @@ class TestNaNInsert:
     def test_nulls_do_not_affect_primary_keys(self):
         """Test against a case that previously caused a bug when skipping existing entries."""
         self.rel.insert(((i, value) for i, value in enumerate(self.a)), skip_duplicates=True)
+
+    def test_load_data_nan(self):
+        """Test that NaNs are loaded as nulls through LOAD DATA"""
+        with dj.config(database__local_infile=True):
+            connection = dj.Connection(CONN_INFO['host'], CONN_INFO['user'], CONN_INFO['passwd'])
+            FreeRelation(connection, self.rel.full_table_name).insert(
+                ((10 + i, value) for i, value in enumerate(self.a)), method='load_data')
+            connection.close()
+        values = [row['value'] for row in (self.rel & 'id >= 10').fetch(order_by=['id'], as_dict=True)]
+        assert_true([v is None for v in values] == list(np.isnan(self.a)), 'NaNs are not loaded as nulls')
@@ -2,12 +2,12 @@ from inspect import getmembers
 import re
 
 import numpy as np
-from nose.tools import assert_equal, assert_not_equal, assert_true, assert_list_equal, raises
-from . import schema
+from nose.tools import assert_equal, assert_not_equal, assert_true, assert_list_equal, assert_raises, raises
+from . import schema, CONN_INFO
 from pymysql import IntegrityError, ProgrammingError
 import datajoint as dj
 from datajoint import utils
-from datajoint.base_relation import BaseRelation
+from datajoint.base_relation import BaseRelation, FreeRelation
 from unittest.mock import patch
 
 
@@ -127,6 +127,18 @@ class TestRelation:
             dtype=self.subject.heading.as_dtype)
         self.subject.insert(tmp, skip_duplicates=True)
 
+    def test_skip_duplicate_mixed(self):
+        """Tests that new rows are inserted and duplicates are skipped by one insert"""
+        rows = [(i, 'dup%d' % i, 'mouse', '2016-01-01', 'original') for i in range(3000, 3003)]
+        self.subject.insert(rows[:2])
+        self.subject.insert([row[:-1] + ('repeated',) for row in rows], skip_duplicates=True)
+        rel = self.subject & 'subject_id between 3000 and 3002'
+        assert_equal(len(rel), 3)
+        assert_equal(len(rel & 'subject_notes="original"'), 2)
+        self.subject.insert1((3003, 'dup3000', 'mouse', '2016-01-01', ''), skip_duplicates=True)  # unique index
+        assert_equal(len(self.subject & 'subject_id=3003'), 0)
+        rel.delete_quick()
+
     @raises(IntegrityError)
     def test_not_skip_duplicate(self):
         """Tests if duplicates are not skipped."""
@@ -137,6 +149,164 @@ class TestRelation:
             dtype=self.subject.heading.as_dtype)
         self.subject.insert(tmp, skip_duplicates=False)
 
+    def test_chunked_insert(self):
+        """Tests inserts split into several statements"""
+        rows = [(i, 'chunk%d' % i, 'mouse', '2016-01-01', '') for i in range(1000, 1010)]
+        with dj.config(insert__max_rows=3):
+            self.subject.insert(rows)
+            assert_equal(len(self.subject & 'subject_id between 1000 and 1009'), 10)
+            # a failing statement rolls back the statements before it
+            more_rows = [(i, 'chunk%d' % i, 'mouse', '2016-01-01', '') for i in range(1010, 1020)]
+            assert_raises(IntegrityError, self.subject.insert, more_rows + rows[:1])
+        assert_equal(len(self.subject & 'subject_id between 1010 and 1019'), 0)
+        (self.subject & 'subject_id between 1000 and 1009').delete_quick()
+
+    def test_generator_insert(self):
+        """Tests that generators are consumed in chunks"""
+        consumed = []
+        consumed_at_insert = []
+        connection = self.subject.connection
+        query = connection.query
+
+        def recording_query(sql, *args, **kwargs):
+            if sql.startswith('INSERT'):
+                consumed_at_insert.append(len(consumed))
+            return query(sql, *args, **kwargs)
+
+        def rows():
+            for i in range(5000, 5020):
+                consumed.append(i)
+                yield dict(subject_id=i, real_id='gen%d' % i, species='mouse', date_of_birth='2016-01-01',
+                           subject_notes='')
+
+        with dj.config(insert__max_rows=4), patch.object(connection, 'query', recording_query):
+            self.subject.insert(rows())
+        rel = self.subject & 'subject_id between 5000 and 5019'
+        assert_equal(len(rel), 20)
+        assert_equal(len(consumed_at_insert), 5)
+        assert_true(consumed_at_insert[0] < 20, 'the generator was consumed before the first statement was sent')
+        rel.delete_quick()
+        self.subject.insert(iter(()))
+
+    def test_async_inserter(self):
+        """Tests inserting from a background thread"""
+        rel = self.subject & 'subject_id between 6000 and 6009'
+        with dj.async_inserter(self.subject) as inserter:
+            for i in range(6000, 6010):
+                inserter.insert1((i, 'async%d' % i, 'mouse', '2016-01-01', ''))
+            inserter.flush()
+            assert_equal(len(rel), 10)
+        with dj.config(cache__max_bytes=1000000, cache__revalidate=None):
+            cached = self.subject & 'subject_id between 6000 and 6010'
+            assert_equal(len(cached.fetch()), 10)
+            with dj.async_inserter(self.subject) as inserter:
+                inserter.insert1((6010, 'async6010', 'mouse', '2016-01-01', ''))
+                inserter.flush()
+                assert_equal(len(cached.fetch()), 11)  # the cached result was invalidated by flush
+            assert_raises(dj.DataJointError, inserter.flush)  # closed
+            (self.subject & 'subject_id=6010').delete_quick()
+        inserter = dj.inserter.AsyncInserter(self.subject)
+        inserter.insert1((6000, 'async6000', 'mouse', '2016-01-01', ''))
+        assert_raises(IntegrityError, inserter.flush)
+        assert_raises(dj.DataJointError, inserter.close)
+        rel.delete_quick()
+
+    def test_bulk_load(self):
+        """Tests loading with deferred foreign key checks"""
+        connection = self.subject.connection
+        with connection.bulk_load():
+            self.subject.insert1((7000, 'bulk7000', 'mouse', '2016-01-01', ''))
+            self.experiment.insert1(dict(subject_id=7000, experiment_id=1, experiment_date='2016-01-02',
+                                         username='Jake'))
+        assert_equal(len(self.experiment & 'subject_id=7000'), 1)
+
+        def load_orphan():
+            with connection.bulk_load():
+                self.experiment.insert1(dict(subject_id=7001, experiment_id=1, experiment_date='2016-01-02',
+                                             username='Jake'))
+
+        assert_raises(dj.DataJointError, load_orphan)
+        assert_equal(len(self.experiment & 'subject_id=7001'), 0)
+        assert_equal(connection.query('SELECT @@foreign_key_checks').fetchone()[0], 1)
+        (self.experiment & 'subject_id=7000').delete_quick()
+        (self.subject & 'subject_id=7000').delete_quick()
+
+    def test_merge(self):
+        """Tests updating and inserting rows through a staging table"""
+        rel = self.subject & 'subject_id between 8000 and 8003'
+        self.subject.insert([(i, 'merge%d' % i, 'mouse', '2016-01-01', 'old') for i in (8000, 8001)])
+        self.subject.merge([dict(subject_id=i, real_id='merge%d' % i, species='mouse', date_of_birth='2016-01-01',
+                                 subject_notes='new') for i in (8001, 8002)])
+        notes = dict(zip(*rel.fetch['subject_id', 'subject_notes']))
+        assert_equal(notes, {8000: 'old', 8001: 'new', 8002: 'new'})
+        self.subject.merge(dict(subject_id=np.array([8000]), subject_notes=['newer']))
+        assert_equal((self.subject & 'subject_id=8000').fetch1['subject_notes'], 'newer')
+        self.subject.connection.start_transaction()
+        self.subject.merge(dict(subject_id=np.array([8000]), subject_notes=['rolled back']))
+        self.subject.connection.cancel_transaction()  # the partial merge must not have committed the transaction
+        assert_equal((self.subject & 'subject_id=8000').fetch1['subject_notes'], 'newer')
+        assert_raises(dj.DataJointError, self.subject.merge, dict(subject_notes=['no key']))
+        # a new key cannot be merged without the attributes that have no default
+        assert_raises(dj.DataJointError, self.subject.merge,
+                      dict(subject_id=np.array([8000, 8003]), subject_notes=['newest', 'new key']))
+        assert_equal(len(self.subject & 'subject_id=8003'), 0)
+        assert_equal((self.subject & 'subject_id=8000').fetch1['subject_notes'], 'newer')
+        rel.delete_quick()
+
+    def test_columnar_insert(self):
+        """Tests inserting columns from a dict of arrays"""
+        ids = np.arange(2000, 2005)
+        self.subject.insert(dict(
+            subject_id=ids, real_id=['col%d' % i for i in ids], species=np.array(['mouse'] * len(ids)),
+            date_of_birth=np.array(['2016-01-02'] * len(ids), dtype='datetime64[ns]'), subject_notes=[''] * len(ids)))
+        rel = self.subject & 'subject_id between 2000 and 2004'
+        assert_equal(list(rel.fetch(order_by=['subject_id'])['real_id']), ['col%d' % i for i in ids])
+        assert_equal(set(str(d) for d in rel.fetch['date_of_birth']), {'2016-01-02'})
+        self.subject.insert(rel.fetch(), skip_duplicates=True)
+        assert_equal(len(rel), len(ids))
+        assert_raises(dj.DataJointError, self.subject.insert, dict(
+            subject_id=2005, real_id='col2005', species='mouse', date_of_birth='2016-01-01', subject_notes=''))
+        rel.delete_quick()
+
+    def test_insert_select(self):
+        """Tests inserting the result of a query"""
+        lang = schema.Language()
+        query = self.user.proj(name='username', language='"Esperanto"')
+        lang.insert(query)
+        esperanto = lang & 'language="Esperanto"'
+        assert_equal(set(esperanto.fetch['name']), set(self.user.fetch['username']))
+        lang.insert(query, skip_duplicates=True)
+        assert_equal(len(esperanto), len(self.user))
+        assert_raises(IntegrityError, lang.insert, query)
+        assert_raises(dj.DataJointError, lang.insert, query, method='load_data')
+        esperanto.delete_quick()
+
+    def test_load_data(self):
+        """Tests the round trip of escaped characters and blobs through a file loaded with LOAD DATA"""
+        with dj.config(database__local_infile=True):
+            connection = dj.Connection(CONN_INFO['host'], CONN_INFO['user'], CONN_INFO['passwd'])
+            subject = FreeRelation(connection, self.subject.full_table_name)
+            image = FreeRelation(connection, self.img.full_table_name)
+            notes = ['tab\there', 'line\nbreak', 'back\\slash', '\\N', 'NULL', '']
+            subject.insert([(4000 + i, 'load%d' % i, 'mouse', '2016-01-01', note) for i, note in enumerate(notes)],
+                           method='load_data')
+            images = [np.random.randn(4, 3), np.array([[9, 10], [92, 0]], dtype=np.uint8)]  # tab, newline, backslash
+            image.insert(((4000 + i, img) for i, img in enumerate(images)), method='load_data')
+            connection.close()
+        rel = self.subject & 'subject_id between 4000 and 4999'
+        assert_list_equal(list(rel.fetch(order_by=['subject_id'])['subject_notes']), notes)
+        fetched = (self.img & 'id between 4000 and 4999').fetch(order_by=['id'])['img']
+        for img, loaded in zip(images, fetched):
+            assert_true(img.dtype == loaded.dtype and img.shape == loaded.shape and np.all(img == loaded))
+        rel.delete_quick()
+        (self.img & 'id between 4000 and 4999').delete_quick()
+
+    @raises(dj.DataJointError)
+    def test_load_data_disabled(self):
+        """Tests that loading from a file requires local_infile"""
+        with dj.config(database__local_infile=False):
+            self.subject.insert([(4000, 'load', 'mouse', '2016-01-01', '')], method='load_data')
+
     def test_blob_insert(self):
         """Tests inserting and retrieving blobs."""
         X = np.random.randn(20, 10)
@@ -1,3 +1,4 @@
+import threading
 import numpy as np
 from nose.tools import assert_raises, assert_equal, \
     assert_false, assert_true, assert_list_equal, \
@@ -148,6 +149,10 @@ class TestRelational:
         x = A().proj(a='id_a')
         s = x.preview()
         assert_equal(len(s.split('\n')), len(x)+2)
+        with dj.config(display__limit=len(x)):
+            s = x.preview()
+        assert_true(s.endswith(' (%d tuples)\n' % len(x)) and '...' not in s, 'incorrect preview of a short relation')
+        assert_true('%d tuples' % len(x) in x._repr_html_(), 'incorrect count in HTML preview')
 
     @staticmethod
     def test_heading_repr():
@@ -232,6 +237,74 @@ class TestRelational:
         assert_true(len(w - y) == 0,
                     'incorrect restriction without common attributes')
 
+    @staticmethod
+    def test_semijoin_strategies():
+        x = D()
+        y = L() & 'cond_in_l'
+        expected = len(x & y), len(x - y)
+        for strategy in ('in', 'exists', 'auto'):
+            with dj.config(query__semijoin=strategy):
+                assert_equal((len(x & y), len(x - y)), expected,
+                             'incorrect semijoin or antijoin with strategy %s' % strategy)
+        with dj.config(query__semijoin='exists'):
+            assert_true('exists' in (x - y).make_sql(), 'antijoin is not compiled as NOT EXISTS')
+        with dj.config(query__semijoin='auto'):
+            assert_true('exists' in (x - y).make_sql(), 'antijoin on non-nullable attributes is not NOT EXISTS')
+            assert_true('exists' not in (x & y).make_sql(), 'semijoin is not compiled as IN')
+        assert_true('exists' not in (x - y).make_sql(), 'antijoin is not compiled as NOT IN by default')
+
+    @staticmethod
+    def test_explain():
+        rel = D() - (L() & 'cond_in_l')
+        explanation = rel.explain()
+        assert_equal(explanation['sql'], rel.make_sql())
+        assert_true(len(explanation['plan']) > 0, 'EXPLAIN returned no plan')
+        for step in explanation['plan']:
+            assert_true(isinstance(step['warnings'], list))
+        assert_true(any(step['relation'] == D().full_table_name and step['operator'] == 'query'
+                        for step in explanation['plan']), 'plan steps are not mapped to operators')
+
+    @staticmethod
+    def test_deterministic_sql():
+        """the same expression must always compile into the same SQL text"""
+        def make_rel():
+            x = A().proj(a1='id_a', c1='cond_in_a') & 'c1=0'
+            return (x * B().aggregate(B.C(), n='count(*)')) - (L() & 'cond_in_l')
+        sql = make_rel().make_sql()
+        assert_true('`_s1`' in sql, 'subqueries are not numbered from the start of the statement')
+        assert_equal(sql, make_rel().make_sql())
+        results = []
+        threads = [threading.Thread(target=lambda: results.extend(make_rel().make_sql() for _ in range(50)))
+                   for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert_true(all(r == sql for r in results), 'SQL compilation is not thread-safe')
+        assert_equal(len(make_rel()), len(make_rel()))
+
+    @staticmethod
+    def test_existence():
+        x = D()
+        y = L() & 'cond_in_l'
+        assert_true(x and (x & y) and not (x & 'FALSE'), 'incorrect existence check')
+        key = next(x.fetch.keys())
+        assert_true(key in x and key in x.proj(), 'incorrect containment check')
+        assert_false(dict(key, id_a=-1) in x, 'incorrect containment check')
+        assert_equal(len(x & (y & 'FALSE')), 0, 'incorrect semijoin with an empty relation')
+
+    @staticmethod
+    def test_estimate_len():
+        for rel in (L(), L() & 'cond_in_l', D() * L()):
+            estimate = rel.estimate_len()
+            assert_true(isinstance(estimate, int) and estimate >= 0, 'invalid estimate of len')
+        assert_equal(B().progress(display=False)[0], 0)
+        with dj.config(display__estimated_counts=True):
+            remaining, total = B().progress(display=False)
+            assert_true(0 <= remaining <= total, 'invalid estimated progress')
+            assert_true(remaining <= total // 2, 'populated keys are not estimated as completed')
+            assert_true('tuples' in D().preview())
+
     @staticmethod
     def test_datetime():
         """Test date retrieval"""